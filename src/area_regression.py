@@ -1,53 +1,88 @@
-from utils.read import read_all_grades
+import os
+
+from utils.read import iter_grades
+from utils.parallel import map_years
+from utils.render import Figure, render
+from utils.stats import Histogram2DAccumulator, MomentAccumulator
 import matplotlib.pyplot as plt
 import numpy as np
 
+labels = ["Ciências da Natureza", "Ciências Humanas", "Linguagens", "Matemática", "Redação"]
+
+def draw_pair(i: int, j: int, heatmap, xedges, yedges, r, a, b):
+    f = lambda x: a*x + b
+    extent = [xedges[0], xedges[-1], yedges[0], yedges[-1]]
+
+    plt.clf()
+    plt.imshow(heatmap.T, extent=extent, origin='lower')
+    plt.plot([0, 1000], [f(0), f(1000)], color="white")
+    plt.xlim(0, 1000)
+    plt.ylim(0, 1000)
+    plt.xlabel(labels[i])
+    plt.ylabel(labels[j])
+    plt.subplots_adjust(bottom=0.2, top=0.9)
+    plt.figtext(0.5, 0.025, f"f(x) = {a:.2f}x + {b:.2f}; r = {r:.2f}, r^2 = {r**2:.2f}", ha="center", color="black")
+    plt.gcf().set_size_inches(6, 6)
+
+def report_pair(i: int, j: int, r, a, b):
+    print(f"{labels[i]} and {labels[j]}: r = {r}, r^2 = {r**2}")
+    print(f"Linear regression equation for {labels[i]} and {labels[j]}: f(x) = {a:.4f}x + {b:.4f}")
+
+def accumulate(chunks, bins: int = 50) -> dict[int, tuple[MomentAccumulator, Histogram2DAccumulator]]:
+    # regression moments and heatmap counts of every pair, per year, in one pass
+    per_year = {}
+    for year, grades in chunks:
+        if year not in per_year:
+            per_year[year] = (MomentAccumulator(), Histogram2DAccumulator(bins=bins))
+
+        moments, heatmaps = per_year[year]
+        moments.update(grades)
+        heatmaps.update(grades)
+
+    return per_year
+
+def accumulate_year(year: int, bins: int = 50) -> tuple[MomentAccumulator, Histogram2DAccumulator]:
+    return accumulate(iter_grades([year]), bins).get(year) or (MomentAccumulator(), Histogram2DAccumulator(bins=bins))
+
+def pair_figures(moments: MomentAccumulator, heatmaps: Histogram2DAccumulator) -> list[Figure]:
+    figures = []
+    for (i, j), (r, a, b) in moments.fits().items():
+        report_pair(i, j, r, a, b)
+        figures.append(Figure(f"./output/area_regression/fig{i}_{j}", draw_pair, (i, j, *heatmaps.heatmap(i, j), r, a, b)))
+    return figures
+
+def regression_figures(points: list) -> list[Figure]:
+    points = np.asarray(points, dtype=np.float64)
+    return pair_figures(MomentAccumulator().update(points), Histogram2DAccumulator().update(points))
+
 def regression(points: list):
-    labels = ["Ciências da Natureza", "Ciências Humanas", "Linguagens", "Matemática", "Redação"]
-
-    for i in range(5):
-        for j in range(i+1, 5):
-            xy = sum([v[i]*v[j] for v in points])
-            x = sum([v[i] for v in points])
-            x2 = sum([v[i]**2 for v in points])
-            y = sum([v[j] for v in points])
-            y2 = sum([v[j]**2 for v in points])
-            n = len(points)
-
-            r = (n*xy - x*y)/((n*x2-x**2)*(n*y2 - y**2))**(1/2)
-            print(f"{labels[i]} and {labels[j]}: r = {r}, r^2 = {r**2}")
-
-            # calculate the function equation
-            a = (n*xy - x*y) / (n*x2 - x**2)
-            b = (y - a*x) / n
-            f = lambda x: a*x + b
-            print(f"Linear regression equation for {labels[i]} and {labels[j]}: f(x) = {a:.4f}x + {b:.4f}")
-
-            heatmap, xedges, yedges = np.histogram2d(
-                [v[i] for v in points],
-                [v[j] for v in points],
-                bins=50,
-                range=[[0, 1000], [0, 1000]]
-            )
-            extent = [xedges[0], xedges[-1], yedges[0], yedges[-1]]
-
-            plt.clf()
-            plt.imshow(heatmap.T, extent=extent, origin='lower')
-            plt.plot([0, 1000], [f(0), f(1000)], color="white")
-            plt.xlim(0, 1000)
-            plt.ylim(0, 1000)
-            plt.xlabel(labels[i])
-            plt.ylabel(labels[j])
-            plt.subplots_adjust(bottom=0.2, top=0.9)
-            plt.figtext(0.5, 0.025, f"f(x) = {a:.2f}x + {b:.2f}; r = {r:.2f}, r^2 = {r**2:.2f}", ha="center", color="black")
-            plt.gcf().set_size_inches(6, 6)
-            plt.savefig(f"./output/area_regression/fig{i}_{j}.png", dpi=600, format="png")
-            plt.close()
+    render(regression_figures(points))
+
+def year_figures(per_year: dict[int, tuple[MomentAccumulator, Histogram2DAccumulator]]) -> list[Figure]:
+    # figures of all years together, and fits_by_year.txt, from the accumulators of each year
+    moments = MomentAccumulator.merged([moments for moments, _ in per_year.values()])
+    heatmaps = Histogram2DAccumulator.merged([heatmaps for _, heatmaps in per_year.values()])
+    figures = pair_figures(moments, heatmaps)
+
+    save_yearly_fits({year: moments for year, (moments, _) in per_year.items()})
+    return figures
+
+def regression_years(per_year: dict[int, tuple[MomentAccumulator, Histogram2DAccumulator]]) -> None:
+    render(year_figures(per_year))
+
+def save_yearly_fits(moments: dict[int, MomentAccumulator]) -> None:
+    os.makedirs("./output/area_regression", exist_ok=True)
+    with open("./output/area_regression/fits_by_year.txt", 'w') as file:
+        file.write("year, x, y, n, r, r^2, a, b\n")
+        for year in sorted(moments):
+            for (i, j), (r, a, b) in moments[year].fits().items():
+                file.write(f"{year}, {labels[i]}, {labels[j]}, {moments[year].n}, {r}, {r**2}, {a}, {b}\n")
 
 def main() -> None:
-    data = read_all_grades()
-    regression(data)
-    
+    # each year is accumulated in its own process when ENEM_WORKERS > 1
+    years = [2020, 2021, 2022, 2023, 2024]
+    regression_years(dict(zip(years, map_years(accumulate_year, years))))
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,32 @@
+import time
+
+import numpy as np
+
+from utils.engine import MISSING, convert_response, decode_responses
+
+# micro-benchmark: convert_response per answer vs the lookup-table decoder per column
+def main() -> None:
+    rng = np.random.default_rng(42)
+    n = 2_000_000
+    values = np.array(list("ABCDEFGHIJKLMNOPQ") + list("abcdefghijklmnopq") + [str(i) for i in range(0, 21)] + [""],
+                      dtype="S2")
+    raw = values[rng.integers(0, len(values), n)]
+
+    start = time.perf_counter()
+    strings = [value.decode("ISO-8859-1") for value in raw.tolist()]
+    expected = [convert_response(value) for value in strings]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    codes = decode_responses(raw)
+    table_time = time.perf_counter() - start
+
+    expected = np.array([MISSING if code is None else code for code in expected], dtype=np.uint8)
+    print(f"Answers decoded: {n}")
+    print(f"convert_response: {scalar_time:.3f}s ({n / scalar_time / 1e6:.2f} M answers/s)")
+    print(f"decode_responses: {table_time:.3f}s ({n / table_time / 1e6:.2f} M answers/s)")
+    print(f"Speedup: {scalar_time / table_time:.1f}x")
+    print(f"Same codes: {np.array_equal(codes, expected)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import contextlib
+import io
+import sys
+import time
+
+from mlxtend.frequent_patterns import apriori
+
+from error_cooccurrence import years
+from utils.itemsets import eclat
+from utils.read import read_error_matrix
+
+# benchmark: mlxtend apriori on the boolean DataFrame vs Eclat on the packed errors, same years and thresholds
+# python src/bench_mining.py [max_rows] [min_support] [max_len]
+def main() -> None:
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    min_support = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    max_len = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    print(f"min_support: {min_support}, max_len: {max_len}, max_rows: {max_rows}")
+    for year in years:
+        with contextlib.redirect_stdout(io.StringIO()):
+            errors, _ = read_error_matrix(year, max_rows=max_rows)
+        if len(errors) == 0:
+            print(f"{year}: no data")
+            continue
+
+        start = time.perf_counter()
+        expected = apriori(errors.to_frame(), min_support=min_support, use_colnames=True,
+                           max_len=max_len, low_memory=True)
+        apriori_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        itemsets = eclat(errors, min_support=min_support, max_len=max_len)
+        eclat_time = time.perf_counter() - start
+
+        print(f"{year}: {len(errors)} students, {len(itemsets)} frequent itemsets")
+        print(f"  apriori: {apriori_time:.3f}s")
+        print(f"  eclat:   {eclat_time:.3f}s")
+        print(f"  Speedup: {apriori_time / eclat_time:.1f}x")
+        print(f"  Same itemsets: {expected.equals(itemsets)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from utils.read import read_socioeconomic_data_school_type
+from utils.compact import SocioeconomicData
+from utils.read import read_socioeconomic_compact
 
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
@@ -52,14 +53,14 @@ def cluster(data: list[list], types: list[int]) -> None:
 def evaluate():
     pass
 
-def main() -> None:
-    socioeconomic_data = read_socioeconomic_data_school_type()
-    cleared_data = [v for v in socioeconomic_data if all(i != None for i in v)]
-    del socioeconomic_data
+def cluster_compact(socioeconomic_data: SocioeconomicData) -> None:
+    # students with a school type and every question answered
+    cleared_data = socioeconomic_data.with_school_type().complete()
+    cluster(cleared_data.answers, cleared_data.school_type)
 
-    types = [v[0] for v in cleared_data]
-    components = [v[1:] for v in cleared_data]
-    cluster(components, types)
+def main() -> None:
+    socioeconomic_data = read_socioeconomic_compact()
+    cluster_compact(socioeconomic_data)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
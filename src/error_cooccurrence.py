@@ -1,9 +1,17 @@
-from utils.read import read_error_data
+from utils.compact import ErrorMatrix, WeightedErrors
+from utils.cooccurrence import PairCounts, read_pair_counts
+from utils.itemsets import (ItemsetCounts, cached_itemset_counts, count_itemsets, eclat, frequent_mask,
+                            mine_itemset_counts, negative_border)
+from utils.read import read_error_matrix, sample_error_matrix
+from utils.rules import RuleStatistics, TopRules, frequent_pairs, pair_rules, select_rules
+from utils.stats import wilson_interval
 import pandas as pd
 import numpy as np
 from mlxtend.frequent_patterns import apriori, association_rules
 from mlxtend.preprocessing import TransactionEncoder
 from pathlib import Path
+import math
+import sys
 import time
 import warnings
 
@@ -26,22 +34,83 @@ def mine_association_rules(df: pd.DataFrame, min_support: float = 0.5,
     frequent_itemsets = apriori(df, min_support=min_support, use_colnames=True, 
                                 max_len=max_len, verbose=1, low_memory=True)
     
+    return itemset_rules(frequent_itemsets, min_confidence, min_lift, start_time)
+
+
+def mine_itemset_rules(errors: ErrorMatrix | WeightedErrors, min_support: float = 0.5,
+                       min_confidence: float = 0.6, max_len: int | None = 2,
+                       min_lift: float | None = None, workers: int | None = None) -> pd.DataFrame:
+    # the same itemsets as apriori, mined on per-question bitsets (utils/itemsets.py)
+
+    print(f"Mining Association Rules (Eclat)")
+    print(f"Parameters:")
+    print(f"  min_support: {min_support}")
+    print(f"  min_confidence: {min_confidence}")
+    print(f"  max_len: {max_len}")
+    print(f"  min_lift: {min_lift}")
+
+    start_time = time.time()
+
+    print("\nRunning Eclat algorithm...")
+    frequent_itemsets = eclat(errors, min_support=min_support, max_len=max_len, workers=workers)
+
+    return itemset_rules(frequent_itemsets, min_confidence, min_lift, start_time)
+
+
+def itemset_rules(frequent_itemsets: pd.DataFrame, min_confidence: float,
+                  min_lift: float | None, start_time: float) -> pd.DataFrame:
+
     print(f"  Found {len(frequent_itemsets)} frequent itemsets")
-    
+
     if len(frequent_itemsets) == 0:
         print("  WARNING: No frequent itemsets found. Try lowering min_support.")
         return pd.DataFrame()
 
     print("\nGenerating association rules...")
-    rules = association_rules(frequent_itemsets, metric="confidence", 
+    rules = association_rules(frequent_itemsets, metric="confidence",
                               min_threshold=min_confidence, num_itemsets=len(frequent_itemsets))
-    
+
+    return filter_rules(rules, min_lift, start_time)
+
+
+def mine_pair_rules(errors: ErrorMatrix | WeightedErrors, min_support: float = 0.5,
+                    min_confidence: float = 0.6, min_lift: float | None = None) -> pd.DataFrame:
+    # max_len=2 without apriori: every support comes from one X^T X over the packed rows
+
+    print(f"Mining Association Rules (pairs)")
+    print(f"Parameters:")
+    print(f"  min_support: {min_support}")
+    print(f"  min_confidence: {min_confidence}")
+    print(f"  max_len: 2")
+    print(f"  min_lift: {min_lift}")
+
+    start_time = time.time()
+
+    print("\nCounting item pairs...")
+    pair_counts = errors.pair_counts()
+    item_counts = np.diag(pair_counts)
+    items, _, _, supports = frequent_pairs(item_counts, pair_counts, len(errors), min_support)
+
+    print(f"  Found {len(items) + len(supports)} frequent itemsets")
+
+    if len(items) == 0:
+        print("  WARNING: No frequent itemsets found. Try lowering min_support.")
+        return pd.DataFrame()
+
+    print("\nGenerating association rules...")
+    rules = pair_rules(item_counts, pair_counts, len(errors), min_support, min_confidence)
+
+    return filter_rules(rules, min_lift, start_time)
+
+
+def filter_rules(rules: pd.DataFrame, min_lift: float | None, start_time: float) -> pd.DataFrame:
+
     print(f"  Found {len(rules)} association rules")
-    
+
     if len(rules) == 0:
         print("  WARNING: No rules found. Try lowering min_confidence.")
         return pd.DataFrame()
-    
+
     if min_lift is not None:
         before_count = len(rules)
         rules = rules[rules['lift'] >= min_lift]
@@ -52,13 +121,128 @@ def mine_association_rules(df: pd.DataFrame, min_support: float = 0.5,
             return pd.DataFrame()
 
     rules = rules.sort_values('confidence', ascending=False)
-    
+
     elapsed_time = time.time() - start_time
     print(f"\nMining completed in {elapsed_time:.2f} seconds")
-    
+
     return rules
 
 
+def mine_top_rules(errors: ErrorMatrix | WeightedErrors, min_support: float = 0.5,
+                   min_confidence: float = 0.6, max_len: int | None = 2,
+                   min_lift: float | None = None, top_n: int = 50, by_lift: bool = True,
+                   workers: int | None = None) -> tuple[pd.DataFrame, RuleStatistics]:
+    # the top_n rules by confidence (then lift) and the statistics of all rules, without
+    # ever holding every rule: candidates are generated in batches into a heap and sketches
+
+    print(f"Mining Top {top_n} Association Rules")
+    print(f"Parameters:")
+    print(f"  min_support: {min_support}")
+    print(f"  min_confidence: {min_confidence}")
+    print(f"  max_len: {max_len}")
+    print(f"  min_lift: {min_lift}")
+
+    start_time = time.time()
+
+    print("\nCounting itemsets...")
+    counts = mine_itemset_counts(errors, min_support, max_len, workers)
+    print(f"  Found {len(counts.itemsets)} frequent itemsets")
+
+    print("\nGenerating association rules...")
+    top = TopRules(top_n, 'confidence', 'lift' if by_lift else None)
+    statistics = RuleStatistics(1 / min_support)
+    for batch in counts.rule_batches(min_confidence):
+        if min_lift is not None:
+            batch = select_rules(batch, batch['lift'] >= min_lift)
+        top.update(batch)
+        statistics.update(batch)
+
+    print(f"  Found {statistics.count} association rules, kept the top {len(top.heap)}")
+
+    elapsed_time = time.time() - start_time
+    print(f"\nMining completed in {elapsed_time:.2f} seconds")
+
+    return top.rules(), statistics
+
+
+def sample_margin(rows: int, level: float) -> float:
+    # Hoeffding: the support of an itemset in a uniform sample of rows students is within
+    # this margin of its support in the population with probability level
+    return math.sqrt(math.log(2 / (1 - level)) / (2 * rows))
+
+
+def mine_approximate_rules(sample: ErrorMatrix | WeightedErrors, min_support: float = 0.5,
+                           min_confidence: float = 0.6, max_len: int | None = 2,
+                           min_lift: float | None = None, level: float = 0.95,
+                           workers: int | None = None) -> tuple[pd.DataFrame, ItemsetCounts]:
+    # the rules of a random sample, with Wilson intervals for support and confidence, and the
+    # itemsets of the sample at min_support lowered by sample_margin: the candidates that
+    # verify_rules counts in the full data, so that itemsets near the threshold are not lost
+
+    print(f"Mining Association Rules (sample of {len(sample)} students)")
+    print(f"Parameters:")
+    print(f"  min_support: {min_support}")
+    print(f"  min_confidence: {min_confidence}")
+    print(f"  max_len: {max_len}")
+    print(f"  min_lift: {min_lift}")
+    print(f"  level: {level}")
+
+    start_time = time.time()
+
+    lowered = max(min_support - sample_margin(len(sample), level), 1 / len(sample))
+    print(f"\nCounting itemsets with support >= {lowered:.4f}...")
+    candidates = mine_itemset_counts(sample, lowered, max_len, workers)
+    frequent = candidates.select(min_support)
+    print(f"  Found {len(candidates.itemsets)} candidate itemsets, {len(frequent.itemsets)} frequent in the sample")
+
+    if len(frequent.itemsets) == 0:
+        print("  WARNING: No frequent itemsets found. Try lowering min_support.")
+        return pd.DataFrame(), candidates
+
+    print("\nGenerating association rules...")
+    rules = filter_rules(frequent.rules(min_confidence), min_lift, start_time)
+    if rules.empty:
+        return rules, candidates
+
+    rules['support_low'], rules['support_high'] = wilson_interval(rules['support'], len(sample), level)
+    rules['confidence_low'], rules['confidence_high'] = wilson_interval(
+        rules['confidence'], rules['antecedent support'] * len(sample), level)
+    return rules, candidates
+
+
+def verify_rules(errors: ErrorMatrix | WeightedErrors, candidates: ItemsetCounts, min_support: float = 0.5,
+                 min_confidence: float = 0.6, min_lift: float | None = None) -> tuple[pd.DataFrame, list[tuple]]:
+    # one pass over the full data (Toivonen): exact counts of the sample candidates and of
+    # their negative border; when no border itemset is frequent, the rules are exactly those
+    # of the full data, otherwise the border itemsets that are frequent are returned as misses
+
+    print(f"Verifying {len(candidates.itemsets)} candidate itemsets on {len(errors)} students")
+
+    start_time = time.time()
+
+    border = negative_border(candidates.itemsets, errors.columns, candidates.max_len)
+    counts = count_itemsets(errors, candidates.itemsets + border)
+    exact = ItemsetCounts(candidates.itemsets, counts[:len(candidates.itemsets)], len(errors),
+                          errors.columns, candidates.min_support, candidates.max_len).select(min_support)
+    missed = [itemset for itemset, frequent in
+              zip(border, frequent_mask(border, counts[len(candidates.itemsets):], len(errors), min_support).tolist())
+              if frequent]
+
+    print(f"  Found {len(exact.itemsets)} frequent itemsets, {len(border)} itemsets in the negative border")
+    if missed:
+        print(f"  WARNING: {len(missed)} itemsets of the negative border are frequent, so frequent itemsets "
+              "may be missing. Try a larger sample or the exact mining.")
+    else:
+        print("  No frequent itemset outside the candidates: the rules are exact")
+
+    if len(exact.itemsets) == 0:
+        print("  WARNING: No frequent itemsets found. Try lowering min_support.")
+        return pd.DataFrame(), missed
+
+    print("\nGenerating association rules...")
+    return filter_rules(exact.rules(min_confidence), min_lift, start_time), missed
+
+
 def format_itemset(itemset):
 
     try:
@@ -86,7 +270,7 @@ def format_itemset(itemset):
     return "{" + ", ".join(items) + "}"
 
 
-def save_rules(rules: pd.DataFrame, year: int, top_n: int = 50):
+def save_rules(rules: pd.DataFrame, year: int | str, top_n: int = 50):
 
     output_dir = Path("output/error_cooccurrence")
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -114,6 +298,31 @@ def save_rules(rules: pd.DataFrame, year: int, top_n: int = 50):
     print(f"\nTop {top_n} rules saved to: {output_path}")
 
 
+def save_approximate_rules(rules: pd.DataFrame, year: int, sample_rows: int, level: float, top_n: int = 50):
+
+    output_dir = Path("output/error_cooccurrence")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    output_path = output_dir / f"approximate_rules_{year}_top{top_n}.txt"
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(f"CO-OCORRÊNCIA DE ERROS - ENEM {year}\n")
+        f.write(f"TOP {top_n} REGRAS DE ASSOCIAÇÃO (AMOSTRA DE {sample_rows} ALUNOS, INTERVALOS DE {level*100:.0f}%)\n\n")
+
+        for idx, rule in rules.head(top_n).iterrows():
+            antecedent = format_itemset(rule['antecedents'])
+            consequent = format_itemset(rule['consequents'])
+
+            f.write(f"Rule #{idx + 1}:\n")
+            f.write(f"  {antecedent} => {consequent}\n")
+            f.write(f"  Support:    {rule['support']:.4f} [{rule['support_low']:.4f}, {rule['support_high']:.4f}]\n")
+            f.write(f"  Confidence: {rule['confidence']:.4f} [{rule['confidence_low']:.4f}, {rule['confidence_high']:.4f}]\n")
+            f.write(f"  Lift:       {rule['lift']:.4f}\n")
+            f.write("\n")
+
+    print(f"\nTop {top_n} rules saved to: {output_path}")
+
+
 def print_rules_summary(rules: pd.DataFrame, top_n: int = 10):
 
     print(f"TOP {top_n} ASSOCIATION RULES (by confidence)")
@@ -130,7 +339,19 @@ def print_rules_summary(rules: pd.DataFrame, top_n: int = 10):
         print()
 
 
-def analyze_rules_statistics(rules: pd.DataFrame, year: int):
+def analyze_rules_statistics(rules: pd.DataFrame, year: int | str):
+
+    metrics = {name: (rules[name].mean(), rules[name].median(), rules[name].min(), rules[name].max())
+               for name in ['support', 'confidence', 'lift']}
+
+    rules['antecedent_len'] = rules['antecedents'].apply(len)
+    sizes = {size: (rules['antecedent_len'] == size).sum() for size in sorted(rules['antecedent_len'].unique())}
+
+    write_rules_statistics(year, len(rules), metrics, sizes)
+
+
+def write_rules_statistics(year: int | str, count: int, metrics: dict, sizes: dict):
+    # metrics: {name: (mean, median, min, max)}, sizes: {antecedent size: rules}
 
     output_dir = Path("output/error_cooccurrence")
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -140,36 +361,291 @@ def analyze_rules_statistics(rules: pd.DataFrame, year: int):
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(f"ASSOCIATION RULES STATISTICS - ENEM {year}\n\n")
         
-        f.write(f"Total rules found: {len(rules)}\n\n")
-        
-        f.write("Support Statistics:\n")
-        f.write(f"  Mean:   {rules['support'].mean():.4f}\n")
-        f.write(f"  Median: {rules['support'].median():.4f}\n")
-        f.write(f"  Min:    {rules['support'].min():.4f}\n")
-        f.write(f"  Max:    {rules['support'].max():.4f}\n\n")
-        
-        f.write("Confidence Statistics:\n")
-        f.write(f"  Mean:   {rules['confidence'].mean():.4f}\n")
-        f.write(f"  Median: {rules['confidence'].median():.4f}\n")
-        f.write(f"  Min:    {rules['confidence'].min():.4f}\n")
-        f.write(f"  Max:    {rules['confidence'].max():.4f}\n\n")
-        
-        f.write("Lift Statistics:\n")
-        f.write(f"  Mean:   {rules['lift'].mean():.4f}\n")
-        f.write(f"  Median: {rules['lift'].median():.4f}\n")
-        f.write(f"  Min:    {rules['lift'].min():.4f}\n")
-        f.write(f"  Max:    {rules['lift'].max():.4f}\n\n")
-        
-        rules['antecedent_len'] = rules['antecedents'].apply(len)
+        f.write(f"Total rules found: {count}\n\n")
+
+        for name, title in [('support', 'Support'), ('confidence', 'Confidence'), ('lift', 'Lift')]:
+            mean, median, minimum, maximum = metrics[name]
+            f.write(f"{title} Statistics:\n")
+            f.write(f"  Mean:   {mean:.4f}\n")
+            f.write(f"  Median: {median:.4f}\n")
+            f.write(f"  Min:    {minimum:.4f}\n")
+            f.write(f"  Max:    {maximum:.4f}\n\n")
         
         f.write("Rules by antecedent size:\n")
-        for size in sorted(rules['antecedent_len'].unique()):
-            count = (rules['antecedent_len'] == size).sum()
-            f.write(f"  Size {size}: {count} rules\n")
+        for size, size_count in sizes.items():
+            f.write(f"  Size {size}: {size_count} rules\n")
     
     print(f"Statistics saved to: {output_path}")
 
 
+# Configurações
+years = [2020, 2021, 2022, 2023, 2024]
+min_support = 0.5
+min_confidence = 0.8
+max_len = 2
+min_lift = 1.05
+top_n = 50
+# mine the unique error vectors, weighted by how many students share each
+deduplicate = True
+# keep only the top_n rules in memory, with streamed statistics (for low min_support)
+stream_rules = False
+
+# grid of python src/error_cooccurrence.py sweep
+sweep_supports = [0.3, 0.4, 0.5, 0.6]
+sweep_confidences = [0.6, 0.7, 0.8, 0.9]
+sweep_lifts = [None, 1.05]
+
+# python src/error_cooccurrence.py approx [sample_rows] [verify]
+sample_rows = 100_000
+sample_level = 0.95
+
+
+def deduplicate_errors(errors: ErrorMatrix) -> WeightedErrors:
+
+    start_time = time.time()
+    weighted = errors.deduplicate()
+    elapsed_time = time.time() - start_time
+    print(f"Unique error vectors: {len(weighted.errors)} of {len(errors)} students "
+          f"(compression {weighted.compression():.2f}x, {elapsed_time:.2f} seconds)")
+    return weighted
+
+
+def analyze_year(year: int, df_errors: pd.DataFrame | ErrorMatrix, col_map: list[str] | None):
+
+    global COLUMN_MAPPING
+    COLUMN_MAPPING = col_map
+
+    if len(df_errors) == 0:
+        print(f"  WARNING: No data for year {year}. Skipping.")
+        return
+
+    if not isinstance(df_errors, ErrorMatrix):
+        df_errors = ErrorMatrix.from_bool(df_errors.to_numpy(dtype=bool))
+
+    if deduplicate:
+        df_errors = deduplicate_errors(df_errors)
+
+    if stream_rules:
+        rules, statistics = mine_top_rules(df_errors,
+                                           min_support=min_support,
+                                           min_confidence=min_confidence,
+                                           max_len=max_len,
+                                           min_lift=min_lift,
+                                           top_n=top_n)
+        if statistics.count == 0:
+            print(f"  WARNING: No rules found for year {year}. Skipping.")
+            return
+
+        save_rules(rules, year, top_n=top_n)
+        write_rules_statistics(year, statistics.count, *statistics.summary())
+
+        print_rules_summary(rules, top_n=10)
+        return
+
+    if max_len == 2:
+        rules = mine_pair_rules(df_errors,
+                                min_support=min_support,
+                                min_confidence=min_confidence,
+                                min_lift=min_lift)
+    else:
+        rules = mine_itemset_rules(df_errors,
+                                   min_support=min_support,
+                                   min_confidence=min_confidence,
+                                   max_len=max_len,
+                                   min_lift=min_lift)
+    
+    if rules.empty:
+        print(f"  WARNING: No rules found for year {year}. Skipping.")
+        return
+    
+    save_rules(rules, year, top_n=top_n)
+    analyze_rules_statistics(rules, year)
+    
+    print_rules_summary(rules, top_n=10)
+
+
+def sweep_rules(year: int, errors: ErrorMatrix, supports: list[float], confidences: list[float],
+                lifts: list[float | None], max_len: int | None = 2,
+                workers: int | None = None) -> tuple[pd.DataFrame, dict]:
+    # every (min_support, min_confidence, min_lift) setting from one itemset count at the
+    # lowest support; each rule set is what the mine_* functions return for that setting
+    start_time = time.time()
+    counts = cached_itemset_counts(year, errors, min(supports), max_len, workers)
+
+    summary = []
+    rule_sets = {}
+    for support in sorted(set(supports)):
+        frequent = counts.select(support)
+        candidates = frequent.rules(min(confidences))
+        for confidence in sorted(set(confidences)):
+            # renumbered as association_rules would for this threshold
+            passing = candidates[candidates['confidence'] >= confidence].reset_index(drop=True)
+            for lift in lifts:
+                rules = passing if lift is None else passing[passing['lift'] >= lift]
+                rule_sets[(support, confidence, lift)] = rules.sort_values('confidence', ascending=False)
+                summary.append({
+                    "min_support": support,
+                    "min_confidence": confidence,
+                    "min_lift": lift,
+                    "frequent_itemsets": len(frequent.itemsets),
+                    "rules": len(rules),
+                })
+
+    elapsed_time = time.time() - start_time
+    print(f"Sweep of {len(summary)} settings completed in {elapsed_time:.2f} seconds")
+
+    return pd.DataFrame(summary), rule_sets
+
+
+def save_sweep_summary(summary: pd.DataFrame, year: int):
+
+    output_dir = Path("output/error_cooccurrence")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    output_path = output_dir / f"sweep_{year}.txt"
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(f"REGRAS POR CONFIGURAÇÃO - ENEM {year}\n\n")
+        f.write(summary.to_string(index=False))
+        f.write("\n")
+
+    print(f"Sweep summary saved to: {output_path}")
+
+
+def sweep():
+
+    for year in years:
+        errors, _ = read_error_matrix(year, max_rows=None)
+        if len(errors) == 0:
+            print(f"  WARNING: No data for year {year}. Skipping.")
+            continue
+
+        summary, _ = sweep_rules(year, errors, sweep_supports, sweep_confidences, sweep_lifts, max_len=max_len)
+        save_sweep_summary(summary, year)
+        print(summary.to_string(index=False))
+
+
+def year_rule_table(per_year: dict[int, PairCounts], min_support: float, min_confidence: float,
+                    min_lift: float | None) -> pd.DataFrame:
+    # one row per pair rule found in any year: its lift in every year, taken from the
+    # counts even where the rule is not frequent, and whether it passes the thresholds there
+    found = {}
+    for year, counts in per_year.items():
+        rules = counts.rules(min_support, min_confidence)
+        if min_lift is not None:
+            rules = rules[rules['lift'] >= min_lift]
+        found[year] = {(min(a), min(c)) for a, c in zip(rules['antecedents'], rules['consequents'])}
+
+    keys = sorted(set().union(*found.values()))
+    antecedents = np.array([key[0] for key in keys], dtype=np.int64)
+    consequents = np.array([key[1] for key in keys], dtype=np.int64)
+
+    table = pd.DataFrame({"antecedent": antecedents, "consequent": consequents})
+    for year, counts in per_year.items():
+        table[f"lift_{year}"] = counts.metrics(antecedents, consequents)["lift"]
+        table[f"rule_{year}"] = [key in found[year] for key in keys]
+    return table
+
+
+def save_drift_report(table: pd.DataFrame, report_years: list[int], top: int = 20):
+
+    output_dir = Path("output/error_cooccurrence")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    label = f"{report_years[0]}-{report_years[-1]}"
+    table.to_csv(output_dir / f"rules_drift_{label}.csv", index=False)
+
+    def rule_line(row, before, after):
+        rule = f"{format_itemset([row['antecedent']])} => {format_itemset([row['consequent']])}"
+        return f"  {rule}  lift {before}: {row[f'lift_{before}']:.4f}  lift {after}: {row[f'lift_{after}']:.4f}\n"
+
+    output_path = output_dir / f"rules_drift_{label}.txt"
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(f"EVOLUÇÃO DAS REGRAS DE ASSOCIAÇÃO - ENEM {label}\n")
+        f.write("(questões identificadas pela posição no caderno de referência de cada área)\n\n")
+
+        for before, after in zip(report_years, report_years[1:]):
+            was, stays = table[f"rule_{before}"], table[f"rule_{after}"]
+            appeared = table[~was & stays].sort_values(f"lift_{after}", ascending=False)
+            disappeared = table[was & ~stays].sort_values(f"lift_{before}", ascending=False)
+            both = table[was & stays]
+            delta = (both[f"lift_{after}"] - both[f"lift_{before}"]).abs().sort_values(ascending=False)
+
+            f.write(f"{before} -> {after}\n")
+            f.write(f"Regras em ambos os anos: {len(both)}\n")
+            f.write(f"Regras que aparecem: {len(appeared)}\n")
+            for _, row in appeared.head(top).iterrows():
+                f.write(rule_line(row, before, after))
+            f.write(f"Regras que desaparecem: {len(disappeared)}\n")
+            for _, row in disappeared.head(top).iterrows():
+                f.write(rule_line(row, before, after))
+            f.write(f"Maiores variações de lift:\n")
+            for index in delta.head(top).index:
+                f.write(rule_line(both.loc[index], before, after))
+            f.write("\n")
+
+    print(f"Drift report saved to: {output_path}")
+
+
+def drift():
+    # cross-year comparison from the stored pair counts; only new or changed years are scanned
+    global COLUMN_MAPPING
+    COLUMN_MAPPING = None
+
+    per_year = {year: counts for year, counts in read_pair_counts(years).items() if counts.rows > 0}
+    if not per_year:
+        print("  WARNING: No data for any year. Skipping.")
+        return
+
+    report_years = sorted(per_year)
+    save_drift_report(year_rule_table(per_year, min_support, min_confidence, min_lift), report_years)
+
+    # pooled rules: the counts of all years added up
+    label = f"{report_years[0]}-{report_years[-1]}"
+    print(f"\nPooled rules {label}")
+    rules = filter_rules(PairCounts.merged(per_year.values()).rules(min_support, min_confidence), min_lift, time.time())
+    if rules.empty:
+        print(f"  WARNING: No pooled rules found for {label}.")
+        return
+
+    save_rules(rules, label, top_n=top_n)
+    analyze_rules_statistics(rules, label)
+
+
+def approximate(rows: int = sample_rows, verify: bool = False):
+    # rules of a random sample of each year, then optionally checked with one full pass
+    global COLUMN_MAPPING
+
+    for year in years:
+        # a fixed seed per year, so the sample and its rules can be reproduced
+        sample, col_map = sample_error_matrix(year, rows, seed=year)
+        COLUMN_MAPPING = col_map
+        if len(sample) == 0:
+            print(f"  WARNING: No data for year {year}. Skipping.")
+            continue
+
+        if deduplicate:
+            sample = deduplicate_errors(sample)
+
+        rules, candidates = mine_approximate_rules(sample, min_support, min_confidence, max_len, min_lift, sample_level)
+        if not rules.empty:
+            save_approximate_rules(rules, year, len(sample), sample_level, top_n=top_n)
+            print_rules_summary(rules, top_n=10)
+
+        if not verify:
+            continue
+
+        errors, _ = read_error_matrix(year, max_rows=None)
+        if deduplicate:
+            errors = deduplicate_errors(errors)
+        rules, _ = verify_rules(errors, candidates, min_support, min_confidence, min_lift)
+        if rules.empty:
+            print(f"  WARNING: No rules found for year {year}. Skipping.")
+            continue
+
+        save_rules(rules, year, top_n=top_n)
+        analyze_rules_statistics(rules, year)
+
+
 def main():
 
     print("ERROR CO-OCCURRENCE ANALYSIS - ENEM")
@@ -178,45 +654,11 @@ def main():
     print("  - min_confidence: 0.6 (60%)")
     print("  - max_items: 3")
     print("  - top_rules: 50 per year")
-    
-    # Configurações
-    years = [2020, 2021, 2022, 2023, 2024]
-    min_support = 0.5
-    min_confidence = 0.8
-    max_len = 2
-    min_lift = 1.05
-    top_n = 50
         
     for year in years:
         try:
-            res = read_error_data(year, max_rows=None, return_mapping=True)
-            if isinstance(res, tuple):
-                df_errors, col_map = res
-            else:
-                df_errors = res
-                col_map = None
-
-            global COLUMN_MAPPING
-            COLUMN_MAPPING = col_map
-
-            if df_errors.empty:
-                print(f"  WARNING: No data for year {year}. Skipping.")
-                continue
-            
-            rules = mine_association_rules(df_errors, 
-                                          min_support=min_support,
-                                          min_confidence=min_confidence,
-                                          max_len=max_len,
-                                          min_lift=min_lift)
-            
-            if rules.empty:
-                print(f"  WARNING: No rules found for year {year}. Skipping.")
-                continue
-            
-            save_rules(rules, year, top_n=top_n)
-            analyze_rules_statistics(rules, year)
-            
-            print_rules_summary(rules, top_n=10)
+            errors, col_map = read_error_matrix(year, max_rows=None)
+            analyze_year(year, errors, col_map)
             
         except Exception as e:
             print(f"ERROR processing year {year}: {e}")
@@ -228,4 +670,12 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # python src/error_cooccurrence.py [sweep|drift|approx [sample_rows] [verify]]
+    if len(sys.argv) > 1 and sys.argv[1] == "sweep":
+        sweep()
+    elif len(sys.argv) > 1 and sys.argv[1] == "drift":
+        drift()
+    elif len(sys.argv) > 1 and sys.argv[1] == "approx":
+        approximate(int(sys.argv[2]) if len(sys.argv) > 2 else sample_rows, "verify" in sys.argv[3:])
+    else:
+        main()
@@ -0,0 +1,20 @@
+import sys
+
+from utils.parallel import map_years
+from utils.read import ingest_year
+
+def main() -> None:
+    # python src/ingest.py [workers]
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    years = [2020, 2021, 2022, 2023, 2024]
+
+    print("Building columnar cache...")
+    for year, manifests in zip(years, map_years(ingest_year, years, workers)):
+        if not manifests:
+            print(f"No files found for year {year}, skipping.")
+
+        for manifest in manifests:
+            print(f"{year}: {manifest['rows']} rows, {len(manifest['columns'])} columns cached.")
+
+if __name__ == "__main__":
+    main()
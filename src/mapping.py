@@ -1,135 +1,146 @@
-import geopandas as gpd
+import sys
+
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 
-from utils.read import read_uf_grades_type
+from utils.compact import PRIVATE_SCHOOL, UFS
+from utils.geo import join_codes, join_values, layer_for, prepare_layer
+from utils.render import Figure, output_dpi, render
+from utils.read import read_municipality_totals, read_uf_school_type_totals
+from utils.stats import GroupTotals, KeyedTotals
 
 # standardized upper and lower bounds for graph scales
 std_upper = 650
 std_lower = 450
 
-def plot_avg(data: list[list]) -> None:
-    state_sums = {}
-    state_count = {}
-    for v in data:
-        # v[1] is the uf code
-        if v[1] not in state_sums:
-            state_sums[v[1]] = 0
-
-        if v[1] not in state_count:
-            state_count[v[1]] = 0
+STATES_SHAPEFILE = "./src/geo/BR_UF_2024.shp"
+MUNICIPALITIES_SHAPEFILE = "./src/geo/BR_Municipios_2024.shp"
 
-        state_sums[v[1]] += sum(v[2:])/5
-        state_count[v[1]] += 1
+# municipalities with fewer students than this are left blank
+min_students = 30
+municipality_labels = {
+    "CO_MUNICIPIO_ESC": ("school_municipality", "município da escola"),
+    "CO_MUNICIPIO_PROVA": ("test_municipality", "município de prova"),
+}
 
+# also draw the state maps and ranks of each year alone (suffix _[year]), 20 more maps;
+# python src/mapping.py uf anos turns it on for one run
+year_maps = False
 
-    state_avgs = {}
-    for k in state_sums.keys():
-        state_avgs[k] = state_sums[k]/state_count[k]
+def public_private(totals: GroupTotals) -> tuple[np.ndarray, np.ndarray]:
+    # (uf code, [public, private]) sums of the average grade and student counts
+    def split(cells):
+        return np.column_stack([cells.sum(axis=1) - cells[:, PRIVATE_SCHOOL], cells[:, PRIVATE_SCHOOL]])
+    return split(totals.sums), split(totals.counts)
 
-    # loads shapefile
-    # downloaded from ibge
-    states = gpd.read_file("./src/geo/BR_UF_2024.shp")
+def by_uf(values: np.ndarray, present: np.ndarray) -> dict:
+    # uf code 0 (unknown uf) is never reported
+    return {UFS[code - 1]: value for code, value in enumerate(values.tolist()) if code > 0 and present[code]}
 
-    # adds values to map
-    for i, row in states.iterrows():
-        code = row['SIGLA_UF']
-        states.at[i, 'value'] = state_avgs[code]
+def draw_states(values: dict, title: str, vmin: float | None = None, vmax: float | None = None) -> None:
+    # shapefile downloaded from ibge, simplified to the output resolution (see utils/geo.py)
+    states = join_values(layer_for(STATES_SHAPEFILE, 8, output_dpi()), "SIGLA_UF", values)
 
     # plots map
     fig, ax = plt.subplots(figsize=(8, 8))
     states.plot(column='value', ax=ax, legend=True, cmap="viridis", edgecolor='black',
-                vmin=std_lower, vmax=std_upper)
-    plt.title("Nota média do ENEM por UF")
+                vmin=vmin, vmax=vmax)
+    plt.title(title)
     plt.axis('off')
-    plt.savefig("./output/maps/avg_by_state.png", dpi=600, format="png")
-    plt.close()
-
-    with open("./output/maps/avg_rank.txt", 'w') as file:
-        for k, v in sorted([*state_avgs.items()], key=lambda x: x[1], reverse=True):
-            file.write(f"{k}, {v}\n")
 
-def plot_rel_diff(data: list[list]) -> None:
-    state_sums = {}
-    state_count = {}
-    for v in data:
-        # v[1] is the uf code
-        if v[1] not in state_sums:
-            state_sums[v[1]] = [0, 0]
-
-        if v[1] not in state_count:
-            state_count[v[1]] = [0, 0]
-
-        if int(v[0]) == 4:
-            state_sums[v[1]][1] += sum(v[2:])/5
-            state_count[v[1]][1] += 1
-
-        else:
-            state_sums[v[1]][0] += sum(v[2:])/5
-            state_count[v[1]][0] += 1
-
-    state_diff = {}
-    state_public = {}
-    state_private = {}
-    for k in state_sums.keys():
-        state_diff[k] = ((state_sums[k][1]/state_count[k][1])/(state_sums[k][0]/state_count[k][0]) - 1)*100
-        state_public[k] = state_sums[k][0]/state_count[k][0]
-        state_private[k] = state_sums[k][1]/state_count[k][1]
-
-    # loads shapefile
-    # downloaded from ibge
-    states = gpd.read_file("./src/geo/BR_UF_2024.shp")
-
-    # adds values to map
-    for i, row in states.iterrows():
-        code = row['SIGLA_UF']
-        states.at[i, 'value'] = state_diff[code]
+def draw_municipalities(codes: np.ndarray, values: np.ndarray, title: str, vmin: float | None = None, vmax: float | None = None) -> None:
+    # about 5,570 polygons, so no borders and a grey fill for suppressed or missing municipalities
+    layer = layer_for(MUNICIPALITIES_SHAPEFILE, 8, output_dpi())
+    municipalities = join_codes(layer, MUNICIPALITIES_SHAPEFILE, "CD_MUN", codes, values)
 
-    # plots map
     fig, ax = plt.subplots(figsize=(8, 8))
-    states.plot(column='value', ax=ax, legend=True, cmap="viridis", edgecolor='black')
-    plt.title("Desigualdade relativa entre médias\ndas escolas públicas e privadas por UF")
+    municipalities.plot(column='value', ax=ax, legend=True, cmap="viridis", linewidth=0,
+                        vmin=vmin, vmax=vmax, missing_kwds={"color": "lightgrey"})
+    plt.title(title)
     plt.axis('off')
-    plt.savefig("./output/maps/diff_by_state.png", dpi=600, format="png")
-    plt.close()
 
-    # adds values to map
-    for i, row in states.iterrows():
-        code = row['SIGLA_UF']
-        states.at[i, 'value'] = state_public[code]
-
-    # plots map
-    fig, ax = plt.subplots(figsize=(8, 8))
-    states.plot(column='value', ax=ax, legend=True, cmap="viridis", edgecolor='black',
-                vmin=std_lower, vmax=std_upper)
-    plt.title("Nota média do ENEM por UF\ndentre escolas públicas")
-    plt.axis('off')
-    plt.savefig("./output/maps/public_by_state.png", dpi=600, format="png")
-    plt.close()
+def state_averages(totals: GroupTotals) -> dict:
+    sums, counts = public_private(totals)
+    present = counts.sum(axis=1) > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return by_uf(sums.sum(axis=1) / counts.sum(axis=1), present)
+
+def state_differences(totals: GroupTotals) -> tuple[dict, dict, dict]:
+    sums, counts = public_private(totals)
+    present = counts.sum(axis=1) > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        public = sums[:, 0] / counts[:, 0]
+        private = sums[:, 1] / counts[:, 1]
+        diff = (private / public - 1) * 100
+    return by_uf(diff, present), by_uf(public, present), by_uf(private, present)
+
+def avg_figures(totals: GroupTotals, suffix: str = "", title_suffix: str = "") -> list[Figure]:
+    prepare_layer(STATES_SHAPEFILE)
+    state_avgs = state_averages(totals)
+
+    with open(f"./output/maps/avg_rank{suffix}.txt", 'w') as file:
+        for k, v in sorted([*state_avgs.items()], key=lambda x: x[1], reverse=True):
+            file.write(f"{k}, {v}\n")
 
-    # adds values to map
-    for i, row in states.iterrows():
-        code = row['SIGLA_UF']
-        states.at[i, 'value'] = state_private[code]
+    return [Figure(f"./output/maps/avg_by_state{suffix}", draw_states,
+                   (state_avgs, "Nota média do ENEM por UF" + title_suffix, std_lower, std_upper))]
 
-    # plots map
-    fig, ax = plt.subplots(figsize=(8, 8))
-    states.plot(column='value', ax=ax, legend=True, cmap="viridis", edgecolor='black',
-                vmin=std_lower, vmax=std_upper)
-    plt.title("Nota média do ENEM por UF\ndentre escolas privadas")
-    plt.axis('off')
-    plt.savefig("./output/maps/private_by_state.png", dpi=600, format="png")
-    plt.close()
+def rel_diff_figures(totals: GroupTotals, suffix: str = "", title_suffix: str = "") -> list[Figure]:
+    prepare_layer(STATES_SHAPEFILE)
+    state_diff, state_public, state_private = state_differences(totals)
 
-    with open("./output/maps/diff_by_state_rank.txt", 'w') as file:
+    with open(f"./output/maps/diff_by_state_rank{suffix}.txt", 'w') as file:
         for k, v in sorted([*state_diff.items()], key=lambda x: x[1], reverse=True):
             file.write(f"{k}, {v}, {state_public[k]}, {state_private[k]}\n")
 
+    return [
+        Figure(f"./output/maps/diff_by_state{suffix}", draw_states,
+               (state_diff, "Desigualdade relativa entre médias\ndas escolas públicas e privadas por UF" + title_suffix)),
+        Figure(f"./output/maps/public_by_state{suffix}", draw_states,
+               (state_public, "Nota média do ENEM por UF\ndentre escolas públicas" + title_suffix, std_lower, std_upper)),
+        Figure(f"./output/maps/private_by_state{suffix}", draw_states,
+               (state_private, "Nota média do ENEM por UF\ndentre escolas privadas" + title_suffix, std_lower, std_upper)),
+    ]
+
+def state_figures(totals: GroupTotals, suffix: str = "", title_suffix: str = "") -> list[Figure]:
+    return avg_figures(totals, suffix, title_suffix) + rel_diff_figures(totals, suffix, title_suffix)
+
+def year_figures(per_year: dict[int, GroupTotals]) -> list[Figure]:
+    # the same maps for each year alone, from the tables already aggregated
+    figures = []
+    for year in sorted(per_year):
+        figures += state_figures(per_year[year], f"_{year}", f" ({year})")
+    return figures
+
+def municipality_figures(per_year: dict[int, dict[str, KeyedTotals]], min_count: int = min_students) -> list[Figure]:
+    prepare_layer(MUNICIPALITIES_SHAPEFILE)
+
+    figures = []
+    for year in sorted(per_year):
+        for field, totals in per_year[year].items():
+            name, description = municipality_labels[field]
+            codes, averages, counts = totals.means(min_count)
+
+            with open(f"./output/maps/avg_rank_{name}_{year}.txt", 'w') as file:
+                for i in np.argsort(-averages, kind="stable").tolist():
+                    file.write(f"{codes[i]}, {averages[i]}, {counts[i]}\n")
+
+            figures.append(Figure(f"./output/maps/avg_by_{name}_{year}", draw_municipalities,
+                                  (codes, averages, f"Nota média do ENEM por {description} ({year})", std_lower, std_upper)))
+    return figures
+
 
 def main() -> None:
-    data = read_uf_grades_type()
-    plot_avg(data)
-    plot_rel_diff(data)
+    # python src/mapping.py [uf|municipio] [anos]
+    if len(sys.argv) > 1 and sys.argv[1] == "municipio":
+        render(municipality_figures(read_municipality_totals()))
+        return
+
+    per_year = read_uf_school_type_totals()
+    figures = state_figures(GroupTotals.merged(per_year.values()))
+    if year_maps or "anos" in sys.argv[2:]:
+        figures += year_figures(per_year)
+    render(figures)
 
 if __name__ == "__main__":
     main()
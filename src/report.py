@@ -0,0 +1,37 @@
+import area_regression
+import clustering
+import error_cooccurrence
+import mapping
+import socioeconomic_regression
+from utils.render import render
+from utils.stats import GroupTotals
+from utils.scan import error_consumer, grades_consumer, scan, socioeconomic_compact_consumer, uf_school_type_consumer
+
+# runs every analysis with a single pass over each year's microdata
+def main() -> None:
+    grades = grades_consumer()
+    socioeconomic = socioeconomic_compact_consumer()
+    uf_totals = uf_school_type_consumer()
+    errors = error_consumer(error_cooccurrence.years)
+
+    scan([grades, socioeconomic, uf_totals, errors])
+
+    # figures of all analyses are rendered together at the end, in one pool
+    figures = area_regression.year_figures(grades.result())
+    socioeconomic_data = socioeconomic.result()
+    figures += socioeconomic_regression.regression_figures(socioeconomic_data)
+    clustering.cluster_compact(socioeconomic_data)
+
+    per_year = uf_totals.result()
+    figures += mapping.state_figures(GroupTotals.merged(per_year.values()))
+    if mapping.year_maps:
+        figures += mapping.year_figures(per_year)
+
+    for year, (df_errors, col_map) in errors.result().items():
+        error_cooccurrence.analyze_year(year, df_errors, col_map)
+
+    print(f"Rendering {len(figures)} figures...")
+    render(figures)
+
+if __name__ == "__main__":
+    main()
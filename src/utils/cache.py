@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from utils.engine import CHUNK_ROWS, ENCODING, empty_column, line_offsets, parse_lines, read_columns, read_header, scan_csv
+
+CACHE_DIR = "cache"
+CACHE_VERSION = 1
+HASH_SAMPLE_BYTES = 1 << 20
+
+# set ENEM_CACHE=0 to parse the CSVs directly, e.g. to check results against the cache
+CACHE_ENABLED = os.environ.get("ENEM_CACHE", "1") != "0"
+
+# columns used by the analyses, all cached by python src/ingest.py; the scripts
+# themselves only cache the columns they read
+INGEST_FIELDS = (
+    ["NU_NOTA_CN", "NU_NOTA_CH", "NU_NOTA_LC", "NU_NOTA_MT", "NU_NOTA_REDACAO"]
+    + ["TP_DEPENDENCIA_ADM_ESC", "SG_UF_ESC", "CO_MUNICIPIO_ESC", "CO_MUNICIPIO_PROVA"]
+    + ["TP_PRESENCA_CN", "TP_PRESENCA_CH", "TP_PRESENCA_LC", "TP_PRESENCA_MT"]
+    + [f"Q{str(i).zfill(3)}" for i in range(1, 26)]
+    + [f"TX_RESPOSTAS_{area}" for area in ["CN", "CH", "LC", "MT"]]
+    + [f"TX_GABARITO_{area}" for area in ["CN", "CH", "LC", "MT"]]
+    + ["CO_POSICAO", "SG_AREA", "CO_ITEM", "TX_GABARITO", "TX_COR", "CO_PROVA"]
+)
+
+
+def source_signature(file_name: str) -> dict:
+    stat = os.stat(file_name)
+
+    # hashing the head and tail catches in-place edits that keep size and mtime
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, "rb") as file:
+        digest.update(file.read(HASH_SAMPLE_BYTES))
+        if stat.st_size > HASH_SAMPLE_BYTES:
+            file.seek(-HASH_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(file.read(HASH_SAMPLE_BYTES))
+
+    return {
+        "version": CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": digest.hexdigest(),
+    }
+
+
+def store_path(file_name: str) -> str:
+    return os.path.join(CACHE_DIR, os.path.splitext(os.path.basename(file_name))[0])
+
+
+def load_manifest(file_name: str) -> dict:
+    store = store_path(file_name)
+    signature = source_signature(file_name)
+
+    try:
+        with open(os.path.join(store, "manifest.json")) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = None
+
+    if manifest is None or manifest.get("source") != signature:
+        if manifest is not None:
+            print(f"Cache for {file_name} is stale, rebuilding...")
+        shutil.rmtree(store, ignore_errors=True)
+        os.makedirs(store, exist_ok=True)
+        manifest = {"source": signature, "rows": None, "columns": {}}
+
+    return manifest
+
+
+def save_manifest(file_name: str, manifest: dict) -> None:
+    store = store_path(file_name)
+    tmp_path = os.path.join(store, "manifest.json.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, os.path.join(store, "manifest.json"))
+
+
+def ingest_columns(file_name: str, fields: list[str], manifest: dict, workers: int | None = None) -> None:
+    # every chunk is saved as it is parsed, then copied into one .npy per column once the
+    # row count and the widest string are known, so only one chunk is ever held in memory
+    print(f"Caching {len(fields)} columns of {file_name}...")
+
+    store = store_path(file_name)
+    parts = os.path.join(store, "parts")
+    shutil.rmtree(parts, ignore_errors=True)
+    os.makedirs(parts)
+
+    dtypes = {field: [empty_column(field).dtype] for field in fields}
+    lengths = []
+    for chunk in scan_csv(file_name, fields, workers=workers):
+        for field in fields:
+            np.save(os.path.join(parts, f"{field}.{len(lengths)}.npy"), chunk[field])
+            dtypes[field].append(chunk[field].dtype)
+        lengths.append(len(chunk[fields[0]]))
+
+    rows = sum(lengths)
+    for field in fields:
+        path = os.path.join(store, f"{field}.npy")
+        dtype = np.result_type(*dtypes[field])
+        if rows == 0:
+            np.save(path, np.empty(0, dtype=dtype))
+        else:
+            column = open_memmap(path, mode="w+", dtype=dtype, shape=(rows,))
+            start = 0
+            for i, length in enumerate(lengths):
+                column[start:start + length] = np.load(os.path.join(parts, f"{field}.{i}.npy"))
+                start += length
+            column.flush()
+            del column
+        manifest["columns"][field] = dtype.str
+
+    shutil.rmtree(parts)
+    manifest["rows"] = rows
+    save_manifest(file_name, manifest)
+
+
+def ingest(file_name: str, fields: list[str] | None = None, workers: int | None = None) -> dict:
+    # the given fields, or every INGEST_FIELDS column of the file when none are given
+    manifest = load_manifest(file_name)
+    header = read_header(file_name)
+
+    for field in fields or []:
+        if field not in header:
+            raise KeyError(field)
+
+    wanted = set(fields) if fields is not None else set(INGEST_FIELDS) & set(header)
+    missing = [field for field in header if field in wanted and field not in manifest["columns"]]
+    if missing:
+        ingest_columns(file_name, missing, manifest, workers)
+
+    return manifest
+
+
+def load_columns(file_name: str, fields: list[str], workers: int | None = None) -> dict[str, np.ndarray]:
+    if not CACHE_ENABLED:
+        return read_columns(file_name, fields, workers=workers)
+
+    ingest(file_name, fields, workers)
+    store = store_path(file_name)
+    return {field: np.load(os.path.join(store, f"{field}.npy"), mmap_mode="r") for field in fields}
+
+
+def iter_columns(file_name: str, fields: list[str], chunk_rows: int = CHUNK_ROWS, workers: int | None = None) -> Iterator[dict[str, np.ndarray]]:
+    if not CACHE_ENABLED:
+        yield from scan_csv(file_name, fields, chunk_rows, workers)
+        return
+
+    columns = load_columns(file_name, fields, workers)
+    rows = len(columns[fields[0]]) if fields else 0
+    for start in range(0, rows, chunk_rows):
+        yield {field: values[start:start + chunk_rows] for field, values in columns.items()}
+
+
+def load_line_offsets(file_name: str) -> np.ndarray:
+    # line_offsets, kept next to the cached columns: building it reads every byte of the
+    # file once (without parsing it), later samples only seek to their lines
+    if not CACHE_ENABLED:
+        return line_offsets(file_name)
+
+    manifest = load_manifest(file_name)
+    path = os.path.join(store_path(file_name), "line_offsets.npy")
+    if manifest.get("lines") is None:
+        np.save(path, line_offsets(file_name))
+        manifest["lines"] = len(np.load(path, mmap_mode="r"))
+        save_manifest(file_name, manifest)
+    return np.load(path, mmap_mode="r")
+
+
+def sample_columns(file_name: str, fields: list[str], size: int, seed=None) -> dict[str, np.ndarray]:
+    # a uniform random sample of size lines, without replacement and in file order: taken
+    # from the cached columns when they are already there, otherwise read line by line
+    # through the offset index (see load_line_offsets), parsing only the sampled lines
+    rng = np.random.default_rng(seed)
+    if CACHE_ENABLED:
+        manifest = load_manifest(file_name)
+        if manifest["rows"] is not None and all(field in manifest["columns"] for field in fields):
+            rows = np.sort(rng.choice(manifest["rows"], size=min(size, manifest["rows"]), replace=False))
+            store = store_path(file_name)
+            return {field: np.load(os.path.join(store, f"{field}.npy"), mmap_mode="r")[rows] for field in fields}
+
+    offsets = load_line_offsets(file_name)
+    lines = np.sort(rng.choice(len(offsets), size=min(size, len(offsets)), replace=False))
+    return parse_lines(file_name, read_header(file_name), fields, offsets[lines])
+
+
+def load_frame(file_name: str, fields: list[str]) -> pd.DataFrame:
+    # mirrors pd.read_csv(dtype=str): text columns with empty cells as NaN
+    columns = load_columns(file_name, fields)
+    frame = {}
+    for field in fields:
+        values = columns[field]
+        if values.dtype.kind == "S":
+            values = pd.Series(np.char.decode(values, ENCODING), dtype=object)
+            values[values == ""] = np.nan
+        frame[field] = values
+
+    return pd.DataFrame(frame)
@@ -0,0 +1,236 @@
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from utils.engine import MISSING, answers_to_lists, mean_grades
+
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+       "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+UF_BYTES = np.array(UFS, dtype="S2")
+
+# codes are 1-based so that 0 can mean "missing" (answers use MISSING instead, as 0 is an answer)
+NO_UF = 0
+NO_SCHOOL_TYPE = 0
+PRIVATE_SCHOOL = 4
+
+
+def encode_grades(grades: np.ndarray) -> np.ndarray:
+    # grades have at most one decimal place, so tenths fit a uint16 exactly
+    return np.rint(np.asarray(grades) * 10).astype(np.uint16)
+
+def decode_grades(grades: np.ndarray) -> np.ndarray:
+    return grades.astype(np.float64) / 10
+
+
+def encode_ufs(raw: np.ndarray) -> np.ndarray:
+    raw = np.asarray(raw, dtype="S2")
+    index = np.searchsorted(UF_BYTES, raw)
+    found = UF_BYTES[np.minimum(index, len(UFS) - 1)] == raw
+    return np.where(found, index + 1, NO_UF).astype(np.uint8)
+
+
+def encode_school_types(raw: np.ndarray) -> np.ndarray:
+    raw = np.asarray(raw, dtype=np.float64)
+    return np.where(np.isnan(raw), NO_SCHOOL_TYPE, raw).astype(np.uint8)
+
+
+@dataclass
+class SocioeconomicData:
+    # one entry per student in every array, same rows as read_socioeconomic_data
+    year: np.ndarray         # uint16
+    school_type: np.ndarray  # uint8, NO_SCHOOL_TYPE when missing
+    uf: np.ndarray           # uint8, index into UFS + 1, NO_UF when missing
+    grades: np.ndarray       # (n, 5) uint16 tenths of a point
+    answers: np.ndarray      # (n, 25) uint8 answer codes, MISSING when missing
+
+    def __len__(self) -> int:
+        return len(self.year)
+
+    @classmethod
+    def concat(cls, parts: list["SocioeconomicData"]) -> "SocioeconomicData":
+        return cls(*(np.concatenate([getattr(part, name) for part in parts])
+                     for name in ["year", "school_type", "uf", "grades", "answers"]))
+
+    def select(self, mask: np.ndarray) -> "SocioeconomicData":
+        return SocioeconomicData(self.year[mask], self.school_type[mask], self.uf[mask],
+                                 self.grades[mask], self.answers[mask])
+
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in [self.year, self.school_type, self.uf, self.grades, self.answers])
+
+    def avg_grades(self) -> np.ndarray:
+        return mean_grades(decode_grades(self.grades))
+
+    def with_school_type(self) -> "SocioeconomicData":
+        return self.select(self.school_type != NO_SCHOOL_TYPE)
+
+    def complete(self) -> "SocioeconomicData":
+        # students who answered every question
+        return self.select((self.answers != MISSING).all(axis=1))
+
+    def rows(self) -> list[list]:
+        # [avg grade, Q001, ..., Q025], as read_socioeconomic_data
+        return [[avg_grade] + answers for avg_grade, answers in zip(self.avg_grades().tolist(), answers_to_lists(self.answers))]
+
+    def school_type_rows(self) -> list[list]:
+        # [school type, Q001, ..., Q025], as read_socioeconomic_data_school_type
+        data = self.with_school_type()
+        return [[school_type] + answers for school_type, answers in zip(data.school_type.astype(int).tolist(), answers_to_lists(data.answers))]
+
+
+# rows unpacked at a time when counting, bounds the temporary bool/float arrays
+COUNT_ROWS = 1 << 16
+
+
+@dataclass
+class ErrorMatrix:
+    # one row of bits per student (np.packbits, 23 bytes for 180 questions),
+    # same rows and columns as the read_error_data DataFrame
+    packed: np.ndarray  # (n, ceil(columns / 8)) uint8
+    columns: int
+
+    @classmethod
+    def from_bool(cls, errors: np.ndarray) -> "ErrorMatrix":
+        errors = np.asarray(errors, dtype=bool)
+        return cls(np.packbits(errors, axis=1), errors.shape[1])
+
+    @classmethod
+    def concat(cls, parts: list["ErrorMatrix"]) -> "ErrorMatrix":
+        return cls(np.concatenate([part.packed for part in parts]), parts[0].columns)
+
+    def __len__(self) -> int:
+        return len(self.packed)
+
+    def select(self, mask: np.ndarray) -> "ErrorMatrix":
+        return ErrorMatrix(self.packed[mask], self.columns)
+
+    def nbytes(self) -> int:
+        return self.packed.nbytes
+
+    def digest(self) -> str:
+        # identifies the data itself, e.g. to key results cached on disk
+        digest = hashlib.blake2b(np.ascontiguousarray(self.packed).data, digest_size=16)
+        digest.update(str(self.columns).encode())
+        return digest.hexdigest()
+
+    def unpack(self, start: int = 0, stop: int | None = None) -> np.ndarray:
+        return np.unpackbits(self.packed[start:stop], axis=1, count=self.columns).astype(bool)
+
+    def blocks(self, rows: int = COUNT_ROWS):
+        for start in range(0, len(self), rows):
+            yield self.unpack(start, start + rows)
+
+    def column_counts(self) -> np.ndarray:
+        # students with each question wrong
+        counts = np.zeros(self.columns, dtype=np.int64)
+        for block in self.blocks():
+            counts += block.sum(axis=0)
+        return counts
+
+    def pair_counts(self) -> np.ndarray:
+        # (columns, columns) students with both questions wrong, X^T X block by block;
+        # float32 is exact here because a block never has more than 2^24 rows
+        counts = np.zeros((self.columns, self.columns), dtype=np.int64)
+        for block in self.blocks():
+            block = block.astype(np.float32)
+            counts += np.rint(block.T @ block).astype(np.int64)
+        return counts
+
+    def tidsets(self) -> np.ndarray:
+        # vertical layout, one bitset of students per column, in uint64 words for popcounts
+        words = -(-len(self) // 64)
+        bits = np.zeros((self.columns, words * 8), dtype=np.uint8)
+        for start in range(0, len(self), COUNT_ROWS):
+            block = np.packbits(self.unpack(start, start + COUNT_ROWS).T, axis=1)
+            bits[:, start // 8:start // 8 + block.shape[1]] = block
+        return bits.view(np.uint64)
+
+    def deduplicate(self) -> "WeightedErrors":
+        # identical rows (e.g. blank exams) collapsed into one with a weight: rows are hashed
+        # 64 bits at a time, grouped by pd.factorize and checked against the first row of their group
+        words = row_words(self.packed)
+        hashes = np.zeros(len(self), dtype=np.uint64)
+        for column in range(words.shape[1]):
+            hashes = pd.util.hash_array(hashes ^ words[:, column])
+        codes, _ = pd.factorize(hashes)
+        _, first = np.unique(codes, return_index=True)
+
+        if not np.array_equal(words, words[first[codes]]):
+            # a hash collision: fall back to sorting the rows themselves
+            keys = np.ascontiguousarray(self.packed).view(np.dtype((np.void, self.packed.shape[1]))).ravel()
+            _, first, codes = np.unique(keys, return_index=True, return_inverse=True)
+
+        return WeightedErrors(ErrorMatrix(self.packed[first], self.columns), np.bincount(codes.ravel(), minlength=len(first)))
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.unpack(), dtype=bool)
+
+
+@dataclass
+class WeightedErrors:
+    # an ErrorMatrix with duplicate rows collapsed: weights[i] students have the errors of
+    # row i; counts and supports are the same as those of the full matrix
+    errors: ErrorMatrix
+    weights: np.ndarray  # int64, one per unique row
+
+    @property
+    def columns(self) -> int:
+        return self.errors.columns
+
+    def __len__(self) -> int:
+        # students, not unique rows
+        return int(self.weights.sum())
+
+    def compression(self) -> float:
+        return len(self) / max(len(self.errors), 1)
+
+    def nbytes(self) -> int:
+        return self.errors.nbytes() + self.weights.nbytes
+
+    def digest(self) -> str:
+        digest = hashlib.blake2b(self.errors.digest().encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(self.weights, dtype=np.int64).data)
+        return digest.hexdigest()
+
+    def column_counts(self) -> np.ndarray:
+        counts = np.zeros(self.columns, dtype=np.int64)
+        for start in range(0, len(self.errors), COUNT_ROWS):
+            block = self.errors.unpack(start, start + COUNT_ROWS)
+            counts += self.weights[start:start + COUNT_ROWS] @ block
+        return counts
+
+    def pair_counts(self) -> np.ndarray:
+        # weighted X^T X; float64 is exact while the counts stay below 2^53
+        counts = np.zeros((self.columns, self.columns), dtype=np.int64)
+        for start in range(0, len(self.errors), COUNT_ROWS):
+            block = self.errors.unpack(start, start + COUNT_ROWS).astype(np.float64)
+            weighted = block * self.weights[start:start + COUNT_ROWS, None]
+            counts += np.rint(weighted.T @ block).astype(np.int64)
+        return counts
+
+    def tidsets(self) -> np.ndarray:
+        # bitsets over the unique rows; their counts need weight_planes
+        return self.errors.tidsets()
+
+    def weight_planes(self) -> np.ndarray:
+        # bit b of every weight as a bitset over the unique rows, so the weighted count
+        # of a bitset is the sum of 2^b * popcount(bitset & plane b)
+        bits = max(int(self.weights.max(initial=0)).bit_length(), 1)
+        planes = (self.weights[None, :] >> np.arange(bits)[:, None]) & 1
+        return bitset_words(planes.astype(bool))
+
+
+def row_words(packed: np.ndarray) -> np.ndarray:
+    # packed rows zero-padded to whole uint64 words
+    words = np.zeros((len(packed), -(-packed.shape[1] // 8) * 8), dtype=np.uint8)
+    words[:, :packed.shape[1]] = packed
+    return words.view(np.uint64)
+
+
+def bitset_words(bits: np.ndarray) -> np.ndarray:
+    # (k, n) bools as k bitsets of ceil(n / 64) uint64 words, the layout of ErrorMatrix.tidsets
+    packed = np.zeros((bits.shape[0], -(-bits.shape[1] // 64) * 8), dtype=np.uint8)
+    packed[:, :-(-bits.shape[1] // 8)] = np.packbits(bits, axis=1)
+    return packed.view(np.uint64)
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import CACHE_DIR, CACHE_ENABLED, source_signature
+from utils.compact import ErrorMatrix
+from utils.parallel import map_years
+from utils.read import data_file, items_file, read_error_matrix
+from utils.rules import pair_rules
+
+COOCCURRENCE_DIR = os.path.join(CACHE_DIR, "cooccurrence")
+COOCCURRENCE_VERSION = 1
+
+
+@dataclass
+class PairCounts:
+    # students, and students with each pair of questions wrong (X^T X, whose diagonal
+    # counts each question alone); counts of several years add up into pooled ones.
+    # Columns are positions in the reference booklet of each area, so across years
+    # a column is the same position, not the same item
+    rows: int
+    counts: np.ndarray  # (columns, columns) int64
+    labels: list[str]
+
+    @classmethod
+    def from_errors(cls, errors: ErrorMatrix, labels: list[str]) -> "PairCounts":
+        return cls(len(errors), errors.pair_counts(), list(labels))
+
+    def merge(self, other: "PairCounts") -> "PairCounts":
+        self.rows += other.rows
+        self.counts = self.counts + other.counts
+        return self
+
+    @classmethod
+    def merged(cls, parts: list["PairCounts"]) -> "PairCounts":
+        parts = list(parts)
+        total = cls(0, np.zeros_like(parts[0].counts), [])
+        for part in parts:
+            total.merge(part)
+        return total
+
+    def item_counts(self) -> np.ndarray:
+        return np.diag(self.counts)
+
+    def rules(self, min_support: float, min_confidence: float) -> pd.DataFrame:
+        # as mine_pair_rules, before the lift filter
+        return pair_rules(self.item_counts(), self.counts, self.rows, min_support, min_confidence)
+
+    def metrics(self, antecedents: np.ndarray, consequents: np.ndarray) -> dict:
+        # support, confidence and lift of single-item rules, whether frequent or not
+        with np.errstate(divide="ignore", invalid="ignore"):
+            support = self.counts[antecedents, consequents] / self.rows
+            confidence = self.counts[antecedents, consequents] / self.item_counts()[antecedents]
+            lift = confidence / (self.item_counts()[consequents] / self.rows)
+        return {"support": support, "confidence": confidence, "lift": lift}
+
+    def save(self, path: str, source: dict) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "pairs.npy"), self.counts)
+
+        manifest = {"version": COOCCURRENCE_VERSION, "source": source, "rows": self.rows, "labels": self.labels}
+        with open(os.path.join(path, "manifest.json.tmp"), "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(os.path.join(path, "manifest.json.tmp"), os.path.join(path, "manifest.json"))
+
+    @classmethod
+    def load(cls, path: str, source: dict) -> "PairCounts | None":
+        try:
+            with open(os.path.join(path, "manifest.json")) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != COOCCURRENCE_VERSION or manifest.get("source") != source:
+            return None
+        return cls(manifest["rows"], np.load(os.path.join(path, "pairs.npy")), manifest["labels"])
+
+
+def year_source(year: int) -> dict:
+    # the counts of a year are valid while its microdata and items files are unchanged
+    source = {"data": source_signature(data_file(year))}
+    if os.path.exists(items_file(year)):
+        source["items"] = source_signature(items_file(year))
+    return source
+
+
+def year_pair_counts(year: int) -> PairCounts:
+    # from cache/cooccurrence/<year>, scanning the year only when it is missing or stale
+    path = os.path.join(COOCCURRENCE_DIR, str(year))
+    source = year_source(year)
+    if CACHE_ENABLED:
+        counts = PairCounts.load(path, source)
+        if counts is not None:
+            print(f"Pair counts of {year} loaded from {path}")
+            return counts
+
+    errors, col_map = read_error_matrix(year)
+    counts = PairCounts.from_errors(errors, col_map)
+    if CACHE_ENABLED:
+        counts.save(path, source)
+    return counts
+
+
+def read_pair_counts(years: list[int], workers: int | None = None) -> dict[int, PairCounts]:
+    return dict(zip(years, map_years(year_pair_counts, years, workers)))
@@ -0,0 +1,236 @@
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from utils.parallel import resolve_workers, single_worker
+
+ENCODING = "ISO-8859-1"
+CHUNK_ROWS = 1_000_000
+RANGE_BYTES = 64 << 20
+
+GRADE_FIELDS = ["NU_NOTA_CN", "NU_NOTA_CH", "NU_NOTA_LC", "NU_NOTA_MT", "NU_NOTA_REDACAO"]
+SOCIOECONOMIC_FIELDS = [f"Q{str(i).zfill(3)}" for i in range(1, 26)]
+
+# code used for empty or unparseable questionnaire answers, outside the answer range
+# (letters are 1-26 and numbers 0-254)
+MISSING = 255
+
+
+def is_numeric_field(field: str) -> bool:
+    return field.startswith("NU_NOTA_") or field.startswith("TP_")
+
+
+def read_header(file_name: str) -> list[str]:
+    with open(file_name, encoding=ENCODING) as file:
+        return file.readline().strip().replace("\n", "").split(";")
+
+
+def encode_column(field: str, values: pd.Series) -> np.ndarray:
+    # numeric fields become float64 with NaN for empty cells, the rest raw bytes
+    if is_numeric_field(field):
+        return pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+
+    return values.str.encode(ENCODING).to_numpy().astype(np.bytes_)
+
+
+def empty_column(field: str) -> np.ndarray:
+    return np.empty(0, dtype=np.float64 if is_numeric_field(field) else "S1")
+
+
+def split_byte_ranges(file_name: str, parts: int) -> list[tuple[int, int]]:
+    # [start, end) offsets covering the file after the header, each one
+    # starting right after a newline so no line is cut in two
+    size = os.path.getsize(file_name)
+    with open(file_name, "rb") as file:
+        file.readline()
+        bounds = [file.tell()]
+        body = size - bounds[0]
+
+        for i in range(1, parts):
+            file.seek(max(bounds[0] + body * i // parts, bounds[-1]))
+            file.readline()
+            bounds.append(max(file.tell(), bounds[-1]))
+
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def parse_byte_range(file_name: str, header: list[str], fields: list[str], byte_range: tuple[int, int]) -> dict[str, np.ndarray]:
+    start, end = byte_range
+    with open(file_name, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    return parse_bytes(data, header, fields)
+
+
+def parse_bytes(data: bytes, header: list[str], fields: list[str]) -> dict[str, np.ndarray]:
+    # whole lines of the file, without its header
+    if not data.strip():
+        return {field: empty_column(field) for field in fields}
+
+    frame = pd.read_csv(io.BytesIO(data), sep=";", encoding=ENCODING, header=None, names=header, usecols=fields,
+                        dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+    return {field: encode_column(field, frame[field]) for field in fields}
+
+
+def line_offsets(file_name: str) -> np.ndarray:
+    # start offset of every line after the header, from the newlines of RANGE_BYTES blocks
+    size = os.path.getsize(file_name)
+    with open(file_name, "rb") as file:
+        file.readline()
+        position = file.tell()
+        starts = [np.array([position], dtype=np.int64)]
+        while data := file.read(RANGE_BYTES):
+            starts.append(np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n")) + position + 1)
+            position += len(data)
+
+    offsets = np.concatenate(starts).astype(np.int64)
+    return offsets[offsets < size]
+
+
+def parse_lines(file_name: str, header: list[str], fields: list[str], offsets: np.ndarray) -> dict[str, np.ndarray]:
+    # only the lines starting at the given offsets (see line_offsets), in that order
+    lines = []
+    with open(file_name, "rb") as file:
+        for start in np.asarray(offsets).tolist():
+            file.seek(start)
+            lines.append(file.readline().rstrip(b"\r\n") + b"\n")
+
+    return parse_bytes(b"".join(lines), header, fields)
+
+
+def scan_csv(file_name: str, fields: list[str], chunk_rows: int = CHUNK_ROWS, workers: int | None = None) -> Iterator[dict[str, np.ndarray]]:
+    # only the requested fields are converted, chunk_rows lines at a time;
+    # with several workers the file is cut into line-aligned byte ranges that
+    # are parsed in parallel and still yielded in file order
+    workers = resolve_workers(workers)
+
+    if workers > 1:
+        parts = max(workers, -(-os.path.getsize(file_name) // RANGE_BYTES))
+        ranges = split_byte_ranges(file_name, parts)
+        parse = partial(parse_byte_range, file_name, read_header(file_name), fields)
+
+        # at most 2 * workers ranges in flight, so a slow consumer does not pile up parsed
+        # ranges, and the ones not started yet are cancelled when the caller stops early
+        with ProcessPoolExecutor(max_workers=workers, initializer=single_worker) as executor:
+            pending = deque()
+            try:
+                for byte_range in ranges:
+                    pending.append(executor.submit(parse, byte_range))
+                    if len(pending) >= 2 * workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+        return
+
+    reader = pd.read_csv(file_name, sep=";", encoding=ENCODING, usecols=fields, dtype=str,
+                         keep_default_na=False, quoting=csv.QUOTE_NONE, chunksize=chunk_rows)
+    for chunk in reader:
+        yield {field: encode_column(field, chunk[field]) for field in fields}
+
+
+def read_columns(file_name: str, fields: list[str], chunk_rows: int = CHUNK_ROWS, workers: int | None = None) -> dict[str, np.ndarray]:
+    parts = {field: [] for field in fields}
+    for chunk in scan_csv(file_name, fields, chunk_rows, workers):
+        for field in fields:
+            parts[field].append(chunk[field])
+
+    return {field: np.concatenate(parts[field]) if parts[field] else empty_column(field) for field in fields}
+
+
+# scalar reference for decode_responses, also used by bench_decode.py
+def convert_response(resp):
+    if resp is None or resp == "":
+        return None
+    if resp.upper() in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L",
+                        "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]:
+        return ord(resp.upper()) - ord("A") + 1
+    try:
+        return int(resp)
+    except ValueError:
+        return None
+
+
+def response_tables() -> tuple[np.ndarray, np.ndarray]:
+    # first byte -> answer code (A-Z and a-z -> 1-26, 0-9 -> 0-9, anything else MISSING)
+    codes = np.full(256, MISSING, dtype=np.uint8)
+    for i in range(26):
+        codes[ord("A") + i] = codes[ord("a") + i] = i + 1
+    # byte -> digit value, for answers longer than one character
+    digits = np.full(256, 255, dtype=np.uint8)
+    for i in range(10):
+        codes[ord("0") + i] = digits[ord("0") + i] = i
+    return codes, digits
+
+RESPONSE_CODES, RESPONSE_DIGITS = response_tables()
+
+
+def decode_responses(raw: np.ndarray) -> np.ndarray:
+    # vectorized convert_response over a whole column of raw answer bytes
+    raw = np.ascontiguousarray(raw)
+    width = raw.dtype.itemsize
+    if len(raw) == 0:
+        return np.empty(0, dtype=np.uint8)
+
+    matrix = raw.view(np.uint8).reshape(len(raw), width)
+    codes = RESPONSE_CODES[matrix[:, 0]]
+
+    # numpy pads shorter strings with zero bytes, so a non-zero second byte
+    # means a multi-character answer, which is only valid as a number
+    longer = matrix[:, 1] != 0 if width > 1 else np.zeros(len(raw), dtype=bool)
+    if longer.any():
+        chars = matrix[longer]
+        present = chars != 0
+        digits = RESPONSE_DIGITS[chars]
+
+        value = np.zeros(len(chars), dtype=np.int64)
+        for k in range(width):
+            value = np.where(present[:, k], value * 10 + digits[:, k], value)
+
+        numeric = ((digits != 255) | ~present).all(axis=1) & (value < MISSING)
+        codes[longer] = np.where(numeric, value, MISSING)
+
+    return codes
+
+
+def grade_matrix(columns: dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack([np.asarray(columns[field], dtype=np.float64) for field in GRADE_FIELDS])
+
+
+def valid_grades_mask(grades: np.ndarray) -> np.ndarray:
+    # NaN (empty or non numeric) fails the comparison as well
+    return (grades > 0).all(axis=1)
+
+
+def mean_grades(grades: np.ndarray) -> np.ndarray:
+    # summed left to right so results match sum(row) / 5 bit for bit
+    total = np.zeros(len(grades))
+    for i in range(grades.shape[1]):
+        total = total + grades[:, i]
+    return total / grades.shape[1]
+
+
+def answer_matrix(columns: dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack([decode_responses(columns[field]) for field in SOCIOECONOMIC_FIELDS])
+
+
+def valid_parents_mask(answers: np.ndarray) -> np.ndarray:
+    # Q001/Q002 == 8 and Q003/Q004 == 6 mean "don't know"
+    return ~((answers[:, :2] == 8).any(axis=1) | (answers[:, 2:4] == 6).any(axis=1))
+
+
+def answers_to_lists(answers: np.ndarray) -> list[list]:
+    values = answers.astype(object)
+    values[answers == MISSING] = None
+    return values.tolist()
@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from utils.cache import CACHE_DIR, CACHE_ENABLED, source_signature
+
+GEO_CACHE_DIR = os.path.join(CACHE_DIR, "geo")
+GEO_CACHE_VERSION = 1
+
+# simplification levels in map units (degrees for the IBGE layers); 0 keeps the full geometry
+TOLERANCES = (0.0, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02)
+
+
+def layer_signature(shapefile: str) -> dict:
+    base = os.path.splitext(shapefile)[0]
+    return {
+        "version": GEO_CACHE_VERSION,
+        "shp": source_signature(shapefile),
+        "dbf": source_signature(f"{base}.dbf"),
+    }
+
+
+def layer_store(shapefile: str) -> str:
+    return os.path.join(GEO_CACHE_DIR, os.path.splitext(os.path.basename(shapefile))[0])
+
+
+def save_geometries(path: str, geometries) -> None:
+    # WKB blobs back to back in one uint8 array, plus their end offsets
+    blobs = shapely.to_wkb(np.asarray(geometries))
+    np.save(f"{path}.wkb.npy", np.frombuffer(b"".join(blobs), dtype=np.uint8))
+    np.save(f"{path}.offsets.npy", np.cumsum([0] + [len(blob) for blob in blobs]))
+
+
+def load_geometries(path: str) -> np.ndarray:
+    data = np.load(f"{path}.wkb.npy").tobytes()
+    offsets = np.load(f"{path}.offsets.npy").tolist()
+    return shapely.from_wkb([data[start:end] for start, end in zip(offsets, offsets[1:])])
+
+
+def build_layer(shapefile: str) -> dict:
+    # the shapefile is parsed once; every simplification level is stored next to
+    # the attribute columns, and the manifest is written last so a partial build is never used
+    print(f"Caching geometries of {shapefile}...")
+    layer = gpd.read_file(shapefile)
+    store = layer_store(shapefile)
+    shutil.rmtree(store, ignore_errors=True)
+    os.makedirs(store, exist_ok=True)
+
+    columns = [column for column in layer.columns if column != layer.geometry.name]
+    for column in columns:
+        values = layer[column].to_numpy()
+        np.save(os.path.join(store, f"{column}.npy"), values.astype(str) if values.dtype == object else values)
+
+    for level, tolerance in enumerate(TOLERANCES):
+        geometries = layer.geometry if tolerance == 0 else layer.geometry.simplify(tolerance, preserve_topology=True)
+        save_geometries(os.path.join(store, f"geometry_{level}"), geometries)
+
+    manifest = {
+        "source": layer_signature(shapefile),
+        "crs": layer.crs.to_wkt() if layer.crs is not None else None,
+        "columns": columns,
+        "tolerances": list(TOLERANCES),
+    }
+    with open(os.path.join(store, "manifest.json.tmp"), "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(os.path.join(store, "manifest.json.tmp"), os.path.join(store, "manifest.json"))
+    return manifest
+
+
+def layer_manifest(shapefile: str) -> dict:
+    try:
+        with open(os.path.join(layer_store(shapefile), "manifest.json")) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = None
+
+    if manifest is None or manifest.get("source") != layer_signature(shapefile) or manifest.get("tolerances") != list(TOLERANCES):
+        manifest = build_layer(shapefile)
+    return manifest
+
+
+def prepare_layer(shapefile: str) -> None:
+    # builds the store in the main process, before render workers start reading it
+    if CACHE_ENABLED:
+        layer_manifest(shapefile)
+
+
+def tolerance_for(bounds, width_inches: float, dpi: float) -> float:
+    # the coarsest level whose error stays under half an output pixel
+    pixel = (bounds[2] - bounds[0]) / (width_inches * dpi)
+    return max(tolerance for tolerance in TOLERANCES if tolerance <= pixel / 2)
+
+
+@lru_cache(maxsize=None)
+def read_layer(shapefile: str, tolerance: float) -> gpd.GeoDataFrame:
+    # kept per process, so every map drawn by a worker shares one load
+    if not CACHE_ENABLED:
+        layer = gpd.read_file(shapefile)
+        if tolerance > 0:
+            layer = layer.set_geometry(layer.geometry.simplify(tolerance, preserve_topology=True))
+        return layer
+
+    manifest = layer_manifest(shapefile)
+    store = layer_store(shapefile)
+    frame = {column: np.load(os.path.join(store, f"{column}.npy")) for column in manifest["columns"]}
+    geometries = load_geometries(os.path.join(store, f"geometry_{TOLERANCES.index(tolerance)}"))
+    return gpd.GeoDataFrame(frame, geometry=geometries, crs=manifest["crs"])
+
+
+@lru_cache(maxsize=None)
+def layer_bounds(shapefile: str) -> tuple:
+    return tuple(read_layer(shapefile, TOLERANCES[-1]).total_bounds)
+
+
+def layer_for(shapefile: str, width_inches: float, dpi: float) -> gpd.GeoDataFrame:
+    return read_layer(shapefile, tolerance_for(layer_bounds(shapefile), width_inches, dpi))
+
+
+def join_values(layer: gpd.GeoDataFrame, key: str, values: dict) -> gpd.GeoDataFrame:
+    # one merge instead of a per-row lookup; keys without a value get NaN
+    frame = pd.DataFrame({key: list(values.keys()), "value": list(values.values())})
+    return layer.merge(frame, on=key, how="left")
+
+
+@lru_cache(maxsize=None)
+def code_index(shapefile: str, key: str) -> tuple[np.ndarray, np.ndarray]:
+    # (sorted integer codes, layer row of each); rows are the same at every simplification level
+    codes = read_layer(shapefile, TOLERANCES[-1])[key].to_numpy().astype(np.int64)
+    order = np.argsort(codes, kind="stable")
+    return codes[order], order
+
+
+def join_codes(layer: gpd.GeoDataFrame, shapefile: str, key: str, codes: np.ndarray, values: np.ndarray) -> gpd.GeoDataFrame:
+    # join_values for integer codes, through the precomputed code -> row index;
+    # codes missing from the layer are dropped and rows without a code get NaN
+    sorted_codes, rows = code_index(shapefile, key)
+    position = np.minimum(np.searchsorted(sorted_codes, codes), len(sorted_codes) - 1)
+    found = sorted_codes[position] == codes
+
+    column = np.full(len(layer), np.nan)
+    column[rows[position[found]]] = np.asarray(values)[found]
+    return layer.assign(value=column)
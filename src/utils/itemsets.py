@@ -0,0 +1,334 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import combinations, groupby
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import association_rules
+
+from utils.cache import CACHE_DIR, CACHE_ENABLED
+from utils.compact import ErrorMatrix, WeightedErrors
+from utils.parallel import resolve_workers, single_worker
+from utils.rules import RULE_METRICS, frequent_pairs, pair_rules, rule_metrics
+
+ITEMSET_CACHE_DIR = os.path.join(CACHE_DIR, "itemsets")
+ITEMSET_CACHE_VERSION = 1
+
+# candidate rules held at a time by ItemsetCounts.rule_batches
+RULE_BATCH_ROWS = 1 << 16
+
+# set bits of every byte value
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# ItemsetCounts already mined in this process, by (year, errors digest, max_len)
+itemset_memory = {}
+
+# frequent items of the matrix being mined, set once per worker by init_miner
+miner_items = None
+miner_tidsets = None
+miner_threshold = None
+miner_max_len = None
+miner_planes = None
+
+
+def popcounts(bitsets: np.ndarray) -> np.ndarray:
+    # set bits of each bitset (last axis); numpy < 2 has no np.bitwise_count, so it
+    # looks the bytes up in POPCOUNT_TABLE instead
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitsets).sum(axis=-1, dtype=np.int64)
+    return POPCOUNT_TABLE[np.ascontiguousarray(bitsets).view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def support_counts(tidsets: np.ndarray, planes: np.ndarray | None = None) -> np.ndarray:
+    # students in each bitset; with the weight planes of deduplicated rows (see
+    # WeightedErrors.weight_planes), the sum of the weights of its rows
+    if planes is None:
+        return popcounts(tidsets)
+
+    counts = np.zeros(tidsets.shape[:-1], dtype=np.int64)
+    for bit, plane in enumerate(planes):
+        counts += popcounts(tidsets & plane) << bit
+    return counts
+
+
+def extend(prefix: tuple, items: np.ndarray, tidsets: np.ndarray, k: int,
+           threshold: float, max_len: int | None, planes: np.ndarray | None, found: list) -> None:
+    # depth-first Eclat step: itemsets made of prefix + items[k] + later items, where
+    # tidsets[i] holds the students of prefix + items[i]; found gets
+    # (prefix, extension items, counts) for each frequent class
+    joined = tidsets[k] & tidsets[k + 1:]
+    counts = support_counts(joined, planes)
+    keep = counts >= threshold
+    if not keep.any():
+        return
+
+    prefix = prefix + (int(items[k]),)
+    items, tidsets = items[k + 1:][keep], joined[keep]
+    found.append((prefix, items, counts[keep]))
+    if max_len is None or len(prefix) + 2 <= max_len:
+        for i in range(len(items) - 1):
+            extend(prefix, items, tidsets, i, threshold, max_len, planes, found)
+
+
+def init_miner(items: np.ndarray, tidsets: np.ndarray, threshold: float, max_len: int | None,
+               planes: np.ndarray | None) -> None:
+    global miner_items, miner_tidsets, miner_threshold, miner_max_len, miner_planes
+    miner_items, miner_tidsets, miner_threshold, miner_max_len, miner_planes = items, tidsets, threshold, max_len, planes
+
+
+def miner_worker(items: np.ndarray, tidsets: np.ndarray, threshold: float, max_len: int | None,
+                 planes: np.ndarray | None) -> None:
+    single_worker()
+    init_miner(items, tidsets, threshold, max_len, planes)
+
+
+def mine_prefix(k: int) -> list:
+    found = []
+    extend((), miner_items, miner_tidsets, k, miner_threshold, miner_max_len, miner_planes, found)
+    return found
+
+
+def eclat_counts(errors: ErrorMatrix | WeightedErrors, min_support: float = 0.5, max_len: int | None = None,
+                 workers: int | None = None) -> tuple[list[tuple], np.ndarray]:
+    # apriori's frequent itemsets (same thresholds and order) with their student counts, from
+    # per-question bitsets; the itemsets starting with each item are mined in ENEM_WORKERS processes
+    workers = resolve_workers(workers)
+    rows = len(errors)
+    tidsets = errors.tidsets()
+    planes = errors.weight_planes() if isinstance(errors, WeightedErrors) else None
+    item_counts = support_counts(tidsets, planes)
+    items = np.flatnonzero(item_counts / rows >= min_support)
+    tidsets = tidsets[items]
+    threshold = min_support * rows
+
+    itemsets = [(int(item),) for item in items]
+    counts = item_counts[items].tolist()
+
+    prefixes = range(len(items) - 1) if max_len is None or max_len >= 2 else range(0)
+    if workers <= 1 or len(prefixes) <= 1:
+        init_miner(items, tidsets, threshold, max_len, planes)
+        results = [mine_prefix(k) for k in prefixes]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(prefixes)), initializer=miner_worker,
+                                 initargs=(items, tidsets, threshold, max_len, planes)) as executor:
+            results = list(executor.map(mine_prefix, prefixes))
+
+    for found in results:
+        for prefix, extensions, extension_counts in found:
+            itemsets += [prefix + (item,) for item in extensions.tolist()]
+            counts += extension_counts.tolist()
+
+    order = sorted(range(len(itemsets)), key=lambda i: (len(itemsets[i]), itemsets[i]))
+    return [itemsets[i] for i in order], np.array([counts[i] for i in order], dtype=np.int64)
+
+
+def frequent_mask(itemsets: list[tuple], counts: np.ndarray, rows: int, min_support: float) -> np.ndarray:
+    # apriori's tests: support of single items, count of longer itemsets
+    lengths = np.array([len(itemset) for itemset in itemsets], dtype=np.int64)
+    counts = np.asarray(counts)
+    return np.where(lengths == 1, counts / rows >= min_support, counts >= min_support * rows)
+
+
+def count_itemsets(errors: ErrorMatrix | WeightedErrors, itemsets: list[tuple]) -> np.ndarray:
+    # exact student count of any itemsets, frequent or not, one AND of bitsets per extra item
+    tidsets = errors.tidsets()
+    planes = errors.weight_planes() if isinstance(errors, WeightedErrors) else None
+    counts = np.zeros(len(itemsets), dtype=np.int64)
+    for i, itemset in enumerate(itemsets):
+        joined = tidsets[itemset[0]]
+        for item in itemset[1:]:
+            joined = joined & tidsets[item]
+        counts[i] = support_counts(joined, planes)
+    return counts
+
+
+def negative_border(itemsets: list[tuple], columns: int, max_len: int | None = None) -> list[tuple]:
+    # itemsets (up to max_len items) missing from a downward closed list whose subsets
+    # one item shorter are all in it: the candidates apriori would count next, so if
+    # none of them is frequent, no frequent itemset is missing from the list
+    known = set(itemsets)
+    border = [(item,) for item in range(columns) if (item,) not in known]
+    size = 2
+    while max_len is None or size <= max_len:
+        level = sorted(itemset for itemset in itemsets if len(itemset) == size - 1)
+        if not level:
+            break
+        for prefix, group in groupby(level, key=lambda itemset: itemset[:-1]):
+            lasts = [itemset[-1] for itemset in group]
+            for first, second in combinations(lasts, 2):
+                candidate = prefix + (first, second)
+                if candidate not in known and all(subset in known for subset in combinations(candidate, size - 1)):
+                    border.append(candidate)
+        size += 1
+    return border
+
+
+def split_order(itemset: tuple) -> tuple:
+    # item order in which association_rules enumerates the antecedents of an itemset
+    # from eclat/apriori (its frozenset, rebuilt once more by association_rules)
+    return tuple(frozenset(list(frozenset(list(frozenset(itemset))))))
+
+
+def itemset_frame(itemsets: list[tuple], counts: np.ndarray, rows: int) -> pd.DataFrame:
+    # apriori builds each frozenset twice (ids, then column names), which can change the
+    # iteration order of colliding items, and association_rules splits rules in that order
+    return pd.DataFrame({
+        "support": pd.Series(np.asarray(counts) / rows, dtype=float),
+        "itemsets": pd.Series([frozenset(list(frozenset(itemset))) for itemset in itemsets], dtype="object"),
+    })
+
+
+def eclat(errors: ErrorMatrix | WeightedErrors, min_support: float = 0.5, max_len: int | None = None,
+          workers: int | None = None) -> pd.DataFrame:
+    return itemset_frame(*eclat_counts(errors, min_support, max_len, workers), len(errors))
+
+
+@dataclass
+class ItemsetCounts:
+    # every itemset with support >= min_support, in apriori's order, with its student count;
+    # the itemsets of any higher support are a filter away
+    itemsets: list[tuple]
+    counts: np.ndarray
+    rows: int
+    columns: int
+    min_support: float
+    max_len: int | None
+
+    def select(self, min_support: float) -> "ItemsetCounts":
+        keep = frequent_mask(self.itemsets, self.counts, self.rows, min_support)
+        itemsets = [itemset for itemset, kept in zip(self.itemsets, keep.tolist()) if kept]
+        return ItemsetCounts(itemsets, self.counts[keep], self.rows, self.columns, min_support, self.max_len)
+
+    def frame(self) -> pd.DataFrame:
+        return itemset_frame(self.itemsets, self.counts, self.rows)
+
+    def rules(self, min_confidence: float) -> pd.DataFrame:
+        # association_rules(metric="confidence") on frame(), through pair_rules when there are only pairs
+        if not self.itemsets:
+            return pd.DataFrame(columns=["antecedents", "consequents"] + RULE_METRICS)
+        if max(len(itemset) for itemset in self.itemsets) > 2:
+            return association_rules(self.frame(), metric="confidence", min_threshold=min_confidence,
+                                     num_itemsets=len(self.itemsets))
+
+        item_counts = np.zeros(self.columns, dtype=np.int64)
+        pair_counts = np.zeros((self.columns, self.columns), dtype=np.int64)
+        for itemset, count in zip(self.itemsets, self.counts.tolist()):
+            if len(itemset) == 1:
+                item_counts[itemset[0]] = count
+            else:
+                pair_counts[itemset] = count
+        return pair_rules(item_counts, pair_counts, self.rows, self.min_support, min_confidence)
+
+    def rule_batches(self, min_confidence: float, batch_rows: int = RULE_BATCH_ROWS) -> Iterator[dict]:
+        # the rules association_rules(metric="confidence") would return, in its order and
+        # numbered like its rows, yielded about batch_rows at a time instead of as one frame
+        lookup = dict(zip(self.itemsets, self.counts.tolist()))
+        num_itemsets = len(self.itemsets)
+        passed = 0
+        antecedents, consequents, counts = [], [], []
+
+        for position, itemset in enumerate(self.itemsets):
+            if len(itemset) > 1:
+                items = split_order(itemset)
+                for size in range(len(items) - 1, 0, -1):
+                    for antecedent in combinations(items, size):
+                        consequent = tuple(item for item in items if item not in antecedent)
+                        antecedents.append(antecedent)
+                        consequents.append(consequent)
+                        counts.append((lookup[itemset], lookup[tuple(sorted(antecedent))], lookup[tuple(sorted(consequent))]))
+
+            if len(counts) >= batch_rows or (position == num_itemsets - 1 and counts):
+                sAC, sA, sC = (np.array(column, dtype=np.int64) / self.rows for column in zip(*counts))
+                metrics = rule_metrics(sAC, sA, sC, num_itemsets)
+                keep = metrics["confidence"] >= min_confidence
+                kept = np.flatnonzero(keep).tolist()
+                batch = {
+                    "index": np.arange(passed, passed + len(kept)),
+                    "antecedents": [frozenset(antecedents[i]) for i in kept],
+                    "consequents": [frozenset(consequents[i]) for i in kept],
+                }
+                batch.update({name: values[keep] for name, values in metrics.items()})
+                passed += len(kept)
+                antecedents, consequents, counts = [], [], []
+                yield batch
+
+    def save(self, path: str, digest: str) -> None:
+        # padded item ids and counts as .npy, manifest written last
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        width = max((len(itemset) for itemset in self.itemsets), default=1)
+        items = np.full((len(self.itemsets), width), -1, dtype=np.int16)
+        for row, itemset in enumerate(self.itemsets):
+            items[row, :len(itemset)] = itemset
+        np.save(os.path.join(path, "items.npy"), items)
+        np.save(os.path.join(path, "counts.npy"), self.counts)
+
+        manifest = {
+            "version": ITEMSET_CACHE_VERSION,
+            "digest": digest,
+            "rows": self.rows,
+            "columns": self.columns,
+            "min_support": self.min_support,
+            "max_len": self.max_len,
+        }
+        with open(os.path.join(path, "manifest.json.tmp"), "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(os.path.join(path, "manifest.json.tmp"), os.path.join(path, "manifest.json"))
+
+    @classmethod
+    def load(cls, path: str, digest: str) -> "ItemsetCounts | None":
+        try:
+            with open(os.path.join(path, "manifest.json")) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != ITEMSET_CACHE_VERSION or manifest.get("digest") != digest:
+            return None
+
+        items = np.load(os.path.join(path, "items.npy")).tolist()
+        itemsets = [tuple(item for item in row if item >= 0) for row in items]
+        return cls(itemsets, np.load(os.path.join(path, "counts.npy")), manifest["rows"],
+                   manifest["columns"], manifest["min_support"], manifest["max_len"])
+
+
+def mine_itemset_counts(errors: ErrorMatrix | WeightedErrors, min_support: float, max_len: int | None = 2,
+                        workers: int | None = None) -> ItemsetCounts:
+    rows = len(errors)
+    if max_len != 2:
+        itemsets, counts = eclat_counts(errors, min_support, max_len, workers)
+        return ItemsetCounts(itemsets, counts, rows, errors.columns, min_support, max_len)
+
+    # pairs straight from X^T X, as in mine_pair_rules
+    pair_counts = errors.pair_counts()
+    items, first, second, _ = frequent_pairs(np.diag(pair_counts), pair_counts, rows, min_support)
+    itemsets = [(item,) for item in items.tolist()] + list(zip(first.tolist(), second.tolist()))
+    counts = np.concatenate([np.diag(pair_counts)[items], pair_counts[first, second]])
+    return ItemsetCounts(itemsets, counts, rows, errors.columns, min_support, max_len)
+
+
+def itemset_store(year: int, max_len: int | None) -> str:
+    return os.path.join(ITEMSET_CACHE_DIR, f"{year}_len{max_len or 'all'}")
+
+
+def cached_itemset_counts(year: int, errors: ErrorMatrix | WeightedErrors, min_support: float, max_len: int | None = 2,
+                          workers: int | None = None) -> ItemsetCounts:
+    # mined once per (year, errors, max_len) at the lowest support asked so far, then kept
+    # in memory and under cache/itemsets; a higher support only filters the stored counts
+    digest = errors.digest()
+    key = (year, digest, max_len)
+    counts = itemset_memory.get(key)
+    if counts is None and CACHE_ENABLED:
+        counts = ItemsetCounts.load(itemset_store(year, max_len), digest)
+
+    if counts is None or counts.min_support > min_support:
+        print(f"Counting itemsets of {year} with support >= {min_support}...")
+        counts = mine_itemset_counts(errors, min_support, max_len, workers)
+        if CACHE_ENABLED:
+            counts.save(itemset_store(year, max_len), digest)
+
+    itemset_memory[key] = counts
+    return counts.select(min_support)
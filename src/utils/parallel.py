@@ -0,0 +1,27 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# set ENEM_WORKERS=<n> to read the years in n processes by default
+WORKERS = int(os.environ.get("ENEM_WORKERS", "1"))
+
+
+def resolve_workers(workers: int | None) -> int:
+    return WORKERS if workers is None else workers
+
+
+def single_worker() -> None:
+    # pool initializer: code running inside a worker must not start pools of its own
+    global WORKERS
+    WORKERS = 1
+
+
+def map_years(func, years: list[int], workers: int | None = None) -> list:
+    # results always come back in the order of years, whatever finishes first
+    workers = resolve_workers(workers)
+    years = list(years)
+
+    if workers <= 1 or len(years) <= 1:
+        return [func(year) for year in years]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(years)), initializer=single_worker) as executor:
+        return list(executor.map(func, years))
@@ -1,238 +1,241 @@
+import os
+from functools import partial
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
 
-def read_all_grades() -> list[list]:
+from utils.cache import ingest, iter_columns, load_frame, sample_columns
+from utils.engine import (CHUNK_ROWS, ENCODING, empty_column, GRADE_FIELDS, MISSING, SOCIOECONOMIC_FIELDS, answer_matrix,
+                          grade_matrix, mean_grades, read_header, valid_grades_mask,
+                          valid_parents_mask)
+from utils.compact import PRIVATE_SCHOOL, UFS, ErrorMatrix, SocioeconomicData, encode_grades, encode_school_types, encode_ufs
+from utils.parallel import map_years
+from utils.stats import GroupTotals, KeyedTotals
+
+SCHOOL_TYPE_FIELD = "TP_DEPENDENCIA_ADM_ESC"
+UF_FIELD = "SG_UF_ESC"
+PRESENCE_FIELDS = ["TP_PRESENCA_CN", "TP_PRESENCA_CH", "TP_PRESENCA_LC", "TP_PRESENCA_MT"]
+ATTENDANCE_COLUMNS = SOCIOECONOMIC_FIELDS + ["attended"]
+SOCIOECONOMIC_COMPACT_FIELDS = GRADE_FIELDS + SOCIOECONOMIC_FIELDS + [SCHOOL_TYPE_FIELD, UF_FIELD]
+UF_SCHOOL_TYPE_FIELDS = [SCHOOL_TYPE_FIELD, UF_FIELD] + GRADE_FIELDS
+# average grade totals per (UF code, school type code), see compact.py for the codes
+UF_SCHOOL_TYPE_SHAPE = (len(UFS) + 1, PRIVATE_SCHOOL + 1)
+# IBGE codes of the school's municipality and of the municipality where the test was taken
+MUNICIPALITY_FIELDS = ["CO_MUNICIPIO_ESC", "CO_MUNICIPIO_PROVA"]
+
+def data_file(year: int) -> str:
+    return f"microdados_enem_{year}/DADOS/MICRODADOS_ENEM_{year}.csv" if year != 2024 else f"microdados_enem_{year}/DADOS/RESULTADOS_{year}.csv"
+
+def items_file(year: int) -> str:
+    return f"microdados_enem_{year}/DADOS/ITENS_PROVA_{year}.csv"
+
+
+def grade_arrays(columns: dict[str, np.ndarray]) -> np.ndarray:
+    grades = grade_matrix(columns)
+    return grades[valid_grades_mask(grades)]
+
+def socioeconomic_compact(columns: dict[str, np.ndarray]) -> SocioeconomicData:
+    # rows that pass the grade and parent answer rules; year is filled in by the caller
+    grades = grade_matrix(columns)
+    valid = valid_grades_mask(grades)
+    answers = answer_matrix({field: columns[field][valid] for field in SOCIOECONOMIC_FIELDS})
+
+    keep = valid_parents_mask(answers)
+    return SocioeconomicData(
+        year=np.zeros(keep.sum(), dtype=np.uint16),
+        school_type=encode_school_types(columns[SCHOOL_TYPE_FIELD][valid][keep]),
+        uf=encode_ufs(columns[UF_FIELD][valid][keep]),
+        grades=encode_grades(grades[valid][keep]),
+        answers=answers[keep],
+    )
+
+def uf_grades_type_frame(columns: dict[str, np.ndarray]) -> pd.DataFrame:
+    school_types = np.asarray(columns[SCHOOL_TYPE_FIELD])
+    ufs = np.asarray(columns[UF_FIELD])
+    grades = grade_matrix(columns)
+    valid = ~np.isnan(school_types) & (ufs != b"") & valid_grades_mask(grades)
+
+    frame = pd.DataFrame({
+        SCHOOL_TYPE_FIELD: school_types[valid].astype(np.int64),
+        UF_FIELD: np.char.decode(ufs[valid], ENCODING),
+    })
+    for i, field in enumerate(GRADE_FIELDS):
+        frame[field] = grades[valid, i]
+
+    return frame
+
+def uf_grades_type_to_rows(frame: pd.DataFrame) -> list[list]:
+    school_types = frame[SCHOOL_TYPE_FIELD].astype(str).tolist()
+    ufs = frame[UF_FIELD].tolist()
+    grades = frame[GRADE_FIELDS].to_numpy().tolist()
+
+    return [[school_type, uf] + row for school_type, uf, row in zip(school_types, ufs, grades)]
+
+def uf_school_type_codes(columns: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # same rows as uf_grades_type_frame, as (uf code, school type code, average grade)
+    school_types = np.asarray(columns[SCHOOL_TYPE_FIELD])
+    ufs = np.asarray(columns[UF_FIELD])
+    grades = grade_matrix(columns)
+    valid = ~np.isnan(school_types) & (ufs != b"") & valid_grades_mask(grades)
+
+    return encode_ufs(ufs[valid]), encode_school_types(school_types[valid]), mean_grades(grades[valid])
+
+def uf_school_type_totals(columns: dict[str, np.ndarray]) -> GroupTotals:
+    ufs, school_types, avg_grades = uf_school_type_codes(columns)
+    return GroupTotals(UF_SCHOOL_TYPE_SHAPE).update((ufs, school_types), avg_grades)
+
+def municipality_totals(columns: dict[str, np.ndarray], fields: list[str]) -> dict[str, KeyedTotals]:
+    # average grade totals per municipality code, for each of the given code fields
+    grades = grade_matrix(columns)
+    valid = valid_grades_mask(grades)
+    avg_grades = mean_grades(grades[valid])
+
+    totals = {}
+    for field in fields:
+        codes = np.asarray(columns[field])[valid]
+        present = codes != b""
+        totals[field] = KeyedTotals().update(codes[present].astype(np.int64), avg_grades[present])
+    return totals
+
+def attendance_frame(columns: dict[str, np.ndarray]) -> pd.DataFrame:
+    answers = answer_matrix(columns)
+    presence = [np.asarray(columns[field]) for field in PRESENCE_FIELDS if field in columns]
+    presence = np.column_stack(presence) if presence else np.zeros((len(answers), 0))
+    attended = (presence == 1).any(axis=1).astype(np.int64)
+
+    keep = (answers != MISSING).sum(axis=1) >= 15
+    answers = answers[keep]
+
+    df = {}
+    for i, field in enumerate(SOCIOECONOMIC_FIELDS):
+        values = answers[:, i].astype(np.int64)
+        if (values == MISSING).any():
+            values = np.where(values == MISSING, np.nan, values)
+        df[field] = values
+    df["attended"] = attended[keep]
+
+    return pd.DataFrame(df, columns=ATTENDANCE_COLUMNS)
+
+def attendance_fields(header: list[str]) -> list[str]:
+    if not all(field in header for field in SOCIOECONOMIC_FIELDS):
+        return []
+    return [field for field in PRESENCE_FIELDS if field in header] + SOCIOECONOMIC_FIELDS
+
+def concat_attendance(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    if not frames:
+        return pd.DataFrame([], columns=ATTENDANCE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def concat_arrays(parts: list):
+    if hasattr(parts[0], "concat"):
+        return type(parts[0]).concat(parts)
+    if isinstance(parts[0], pd.DataFrame):
+        return pd.concat(parts, ignore_index=True)
+    if isinstance(parts[0], tuple):
+        return tuple(np.concatenate(values) for values in zip(*parts))
+    return np.concatenate(parts)
+
+def read_year(convert, fields: list[str], year: int):
+    # runs in a worker process when reading in parallel, so it returns
+    # compact arrays rather than lists to keep the transfer cheap
+    return concat_arrays([convert(columns) for columns in iter_columns(data_file(year), fields)] or [convert(empty_columns(fields))])
+
+def empty_columns(fields: list[str]) -> dict[str, np.ndarray]:
+    return {field: empty_column(field) for field in fields}
+
+def read_years(convert, fields: list[str], years: list[int], workers: int | None) -> Iterator[tuple[int, object]]:
+    results = map_years(partial(read_year, convert, fields), years, workers)
+    return zip(years, results)
+
+
+def read_all_grades(workers: int | None = None) -> list[list]:
     data = []
 
     print("Reading data...")
-    for year in range(2020, 2025):
-        file_name = f"microdados_enem_{year}/DADOS/MICRODADOS_ENEM_{year}.csv" if year != 2024 else f"microdados_enem_{year}/DADOS/RESULTADOS_{year}.csv"
-        
-        with open(file_name, encoding="ISO-8859-1") as file:
-            labels = file.readline().strip().replace("\n", "").split(";")
-            labels = {label: i for i, label in enumerate(labels)}
-
-            useful_fields = ["NU_NOTA_CN", "NU_NOTA_CH", "NU_NOTA_LC", "NU_NOTA_MT", "NU_NOTA_REDACAO"]
-            useful_fields = [labels[field] for field in useful_fields]
-
-            for row in file:
-                raw_vals = row.strip().replace("\n", "").split(";")
-                vals = []
-                for index in useful_fields:
-                    if raw_vals[index] == "":
-                        break
-
-                    if not (float(raw_vals[index]) > 0):
-                        break
-
-                    vals.append(float(raw_vals[index]))
-                
-                else:
-                    data.append(vals)
+    for year, grades in read_years(grade_arrays, GRADE_FIELDS, [2020, 2021, 2022, 2023, 2024], workers):
+        data.extend(grades.tolist())
 
         print(f"Read year {year}.")
 
     return data
 
 
-def read_socioeconomic_data() -> list[list]:
-    data = []
+def iter_grades(years: tuple = (2020, 2021, 2022, 2023, 2024), chunk_rows: int = CHUNK_ROWS) -> Iterator[tuple[int, np.ndarray]]:
+    # streaming variant of read_all_grades: (year, valid grades) per chunk of at most chunk_rows rows
+    for year in years:
+        for columns in iter_columns(data_file(year), GRADE_FIELDS, chunk_rows):
+            yield year, grade_arrays(columns)
 
-    def convert_response(resp):
-        if resp is None or resp == "":
-            return None
-        if resp.upper() in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]:
-            return ord(resp.upper()) - ord("A") + 1
-        try:
-            return int(resp)
-        except ValueError:
-            return None
+
+def read_socioeconomic_compact(years: tuple = (2020, 2021, 2023), workers: int | None = None) -> SocioeconomicData:
+    parts = []
 
     print("Reading socioeconomic data...")
-    for year in range(2020, 2024):
-        if year == 2022:
-            continue
-
-        file_name = f"microdados_enem_{year}/DADOS/MICRODADOS_ENEM_{year}.csv"
-        
-        with open(file_name, encoding="ISO-8859-1") as file:
-            labels = file.readline().strip().replace("\n", "").split(";")
-            labels = {label: i for i, label in enumerate(labels)}
-
-            grade_fields = ["NU_NOTA_CN", "NU_NOTA_CH", "NU_NOTA_LC", "NU_NOTA_MT", "NU_NOTA_REDACAO"]
-            grade_indices = [labels[field] for field in grade_fields]
-
-            socioeconomic_fields = [f"Q{str(i).zfill(3)}" for i in range(1, 26)]
-            socioeconomic_indices = [labels[field] for field in socioeconomic_fields]
-
-            for row in file:
-                raw_vals = row.strip().replace("\n", "").split(";")
-
-                grades = []
-                for index in grade_indices:
-                    if raw_vals[index] == "":
-                        break
-
-                    try:
-                        grade = float(raw_vals[index])
-                        if not (grade > 0):
-                            break
-                        grades.append(grade)
-                    except ValueError:
-                        break
-                
-                else:
-                    if len(grades) == 5:
-                        avg_grade = sum(grades) / len(grades)
+    for year, data in read_years(socioeconomic_compact, SOCIOECONOMIC_COMPACT_FIELDS, years, workers):
+        data.year[:] = year
+        parts.append(data)
 
-                        socioeconomic_answers = []
+        print(f"Read year {year}.")
 
-                        skip_row = False 
+    return SocioeconomicData.concat(parts)
 
-                        for i, index in enumerate(socioeconomic_indices):
-                            answer = raw_vals[index] if raw_vals[index] != "" else None
-                            converted = convert_response(answer)
+def read_socioeconomic_data(workers: int | None = None) -> list[list]:
+    return read_socioeconomic_compact(workers=workers).rows()
 
-                            if i < 4 and converted is not None:
-                                if (i < 2 and converted == 8) or (i >= 2 and converted == 6):
-                                    skip_row = True
-                                    break
+def read_socioeconomic_data_school_type(workers: int | None = None) -> list[list]:
+    return read_socioeconomic_compact(workers=workers).school_type_rows()
 
-                            socioeconomic_answers.append(converted)
+def read_uf_grades_type(workers: int | None = None) -> list[list]:
+    data = []
 
-                        if not skip_row:
-                            data.append([avg_grade] + socioeconomic_answers)
+    print("Reading data...")
+    fields = [SCHOOL_TYPE_FIELD, UF_FIELD] + GRADE_FIELDS
+    for year, frame in read_years(uf_grades_type_frame, fields, [2020, 2021, 2022, 2023, 2024], workers):
+        data.extend(uf_grades_type_to_rows(frame))
 
         print(f"Read year {year}.")
 
     return data
 
-def read_socioeconomic_data_school_type() -> list[list]:
-    data = []
 
-    def convert_response(resp):
-        if resp is None or resp == "":
-            return None
-        if resp.upper() in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]:
-            return ord(resp.upper()) - ord("A") + 1
-        try:
-            return int(resp)
-        except ValueError:
-            return None
-
-    print("Reading socioeconomic and school type data...")
-    for year in range(2020, 2024):
-        if year == 2022:
-            continue
-
-        file_name = f"microdados_enem_{year}/DADOS/MICRODADOS_ENEM_{year}.csv"
-        
-        with open(file_name, encoding="ISO-8859-1") as file:
-            labels = file.readline().strip().replace("\n", "").split(";")
-            labels = {label: i for i, label in enumerate(labels)}
-
-            grade_fields = ["NU_NOTA_CN", "NU_NOTA_CH", "NU_NOTA_LC", "NU_NOTA_MT", "NU_NOTA_REDACAO"]
-            grade_indices = [labels[field] for field in grade_fields]
-
-            socioeconomic_fields = [f"Q{str(i).zfill(3)}" for i in range(1, 26)]
-            socioeconomic_indices = [labels[field] for field in socioeconomic_fields]
-
-            school_type_field = "TP_DEPENDENCIA_ADM_ESC"
-            school_type_index = labels[school_type_field]
-
-            for row in file:
-                raw_vals = row.strip().replace("\n", "").split(";")
-
-                if raw_vals[school_type_index] == "":
-                    continue
-
-                grades = []
-                for index in grade_indices:
-                    if raw_vals[index] == "":
-                        break
-
-                    try:
-                        grade = float(raw_vals[index])
-                        if not (grade > 0):
-                            break
-                        grades.append(grade)
-                    except ValueError:
-                        break
-                
-                else:
-                    if len(grades) == 5:
-                        socioeconomic_answers = []
+def year_uf_school_type_totals(year: int, chunk_rows: int = CHUNK_ROWS) -> GroupTotals:
+    totals = GroupTotals(UF_SCHOOL_TYPE_SHAPE)
+    for columns in iter_columns(data_file(year), UF_SCHOOL_TYPE_FIELDS, chunk_rows):
+        totals.merge(uf_school_type_totals(columns))
+    return totals
 
-                        skip_row = False 
-
-                        for i, index in enumerate(socioeconomic_indices):
-                            answer = raw_vals[index] if raw_vals[index] != "" else None
-                            converted = convert_response(answer)
+def read_uf_school_type_totals(years: tuple = (2020, 2021, 2022, 2023, 2024), workers: int | None = None) -> dict[int, GroupTotals]:
+    # one small table per year instead of one row per student; memory does not grow with the data
+    print("Reading data...")
+    return dict(zip(years, map_years(year_uf_school_type_totals, years, workers)))
 
-                            if i < 4 and converted is not None:
-                                if (i < 2 and converted == 8) or (i >= 2 and converted == 6):
-                                    skip_row = True
-                                    break
 
-                            socioeconomic_answers.append(converted)
+def year_municipality_totals(year: int, chunk_rows: int = CHUNK_ROWS) -> dict[str, KeyedTotals]:
+    file_name = data_file(year)
+    fields = [field for field in MUNICIPALITY_FIELDS if field in read_header(file_name)]
 
-                        if not skip_row:
-                            data.append([int(raw_vals[school_type_index])] + socioeconomic_answers)
-
-        print(f"Read year {year}.")
-
-    return data
-
-def read_uf_grades_type() -> list[list]:
-    data = []
+    totals = {field: KeyedTotals() for field in fields}
+    for columns in iter_columns(file_name, fields + GRADE_FIELDS, chunk_rows):
+        for field, part in municipality_totals(columns, fields).items():
+            totals[field].merge(part)
+    return totals
 
+def read_municipality_totals(years: tuple = (2020, 2021, 2022, 2023, 2024), workers: int | None = None) -> dict[int, dict[str, KeyedTotals]]:
+    # {year: {municipality field: totals}}, about 5,570 keys per field instead of one row per student
     print("Reading data...")
-    for year in range(2020, 2025):
-        file_name = f"microdados_enem_{year}/DADOS/MICRODADOS_ENEM_{year}.csv" if year != 2024 else f"microdados_enem_{year}/DADOS/RESULTADOS_{year}.csv"
-        
-        with open(file_name, encoding="ISO-8859-1") as file:
-            labels = file.readline().strip().replace("\n", "").split(";")
-            labels = {label: i for i, label in enumerate(labels)}
-
-            useful_fields = ["TP_DEPENDENCIA_ADM_ESC", "SG_UF_ESC", "NU_NOTA_CN", "NU_NOTA_CH", "NU_NOTA_LC", "NU_NOTA_MT", "NU_NOTA_REDACAO"]
-            useful_fields = [labels[field] for field in useful_fields]
-
-            for row in file:
-                raw_vals = row.strip().replace("\n", "").split(";")
-                vals = []
-                for i, index in enumerate(useful_fields):
-                    if raw_vals[index] == "":
-                        break
-                    
-                    if i > 1:
-                        if not (float(raw_vals[index]) > 0):
-                            break
-
-                        vals.append(float(raw_vals[index]))
-                    
-                    else:
-                        vals.append(raw_vals[index])
-
-                
-                else:
-                    data.append(vals)
+    return dict(zip(years, map_years(year_municipality_totals, years, workers)))
 
-        print(f"Read year {year}.")
-
-    return data
 
+def ingest_year(year: int) -> list[dict]:
+    return [ingest(file_name) for file_name in [data_file(year), items_file(year)] if os.path.exists(file_name)]
 
-def convert_response(resp):
-
-    if resp is None or resp == "":
-        return None
-    if resp.upper() in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", 
-                        "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]:
-        return ord(resp.upper()) - ord("A") + 1
-    try:
-        return int(resp)
-    except ValueError:
-        return None
 
+def print_attendance_summary(df: pd.DataFrame) -> None:
+    print(f"  Total samples: {len(df)}")
+    print(f"  Attended: {df['attended'].sum()} ({df['attended'].mean()*100:.2f}%)")
+    print(f"  Absent: {(df['attended']==0).sum()} ({(1-df['attended'].mean())*100:.2f}%)")
 
 def read_attendance_data(year: int) -> pd.DataFrame:
     
@@ -240,84 +243,40 @@ def read_attendance_data(year: int) -> pd.DataFrame:
     
     print(f"Reading attendance data for year {year}...")
     
-    with open(file_name, encoding="ISO-8859-1") as file:
-        labels = file.readline().strip().replace("\n", "").split(";")
-        label_to_index = {label: i for i, label in enumerate(labels)}
-        
-        presence_fields = ["TP_PRESENCA_CN", "TP_PRESENCA_CH", "TP_PRESENCA_LC", "TP_PRESENCA_MT"]
-        presence_indices = [label_to_index[field] for field in presence_fields if field in label_to_index]
-        
-        socioeconomic_fields = [f"Q{str(i).zfill(3)}" for i in range(1, 26)]
-        socioeconomic_indices = [label_to_index[field] for field in socioeconomic_fields if field in label_to_index]
-        
-        data_rows = []
-        
-        for row in file:
-            raw_vals = row.strip().replace("\n", "").split(";")
-            
-            attended = False
-            for idx in presence_indices:
-                if idx < len(raw_vals):
-                    val = raw_vals[idx]
-                    if val == "1":
-                        attended = True
-                        break
-            
-            socioeconomic_answers = []
-            valid_row = True
-            
-            for idx in socioeconomic_indices:
-                if idx < len(raw_vals):
-                    answer = raw_vals[idx]
-                    converted = convert_response(answer)
-                    socioeconomic_answers.append(converted)
-                else:
-                    valid_row = False
-                    break
-            
-            if valid_row and len(socioeconomic_answers) == 25:
-                non_null_count = sum(1 for ans in socioeconomic_answers if ans is not None)
-                if non_null_count >= 15: 
-                    row_data = socioeconomic_answers + [1 if attended else 0]
-                    data_rows.append(row_data)
-    
-    columns = [f"Q{str(i).zfill(3)}" for i in range(1, 26)] + ["attended"]
-    df = pd.DataFrame(data_rows, columns=columns)
-    
-    print(f"  Total samples: {len(df)}")
-    print(f"  Attended: {df['attended'].sum()} ({df['attended'].mean()*100:.2f}%)")
-    print(f"  Absent: {(df['attended']==0).sum()} ({(1-df['attended'].mean())*100:.2f}%)")
+    fields = attendance_fields(read_header(file_name))
+    frames = [attendance_frame(columns) for columns in iter_columns(file_name, fields)] if fields else []
+    df = concat_attendance(frames)
+
+    print_attendance_summary(df)
     
     return df
 
 
-def read_error_data(year: int, max_rows: int = None, return_mapping: bool = False):
+AREAS = ['CN', 'CH', 'LC', 'MT']
 
-    if(year!=2024):
-        file_name = f"microdados_enem_{year}/DADOS/MICRODADOS_ENEM_{year}.csv"
-    else:
-        file_name = f"microdados_enem_{year}/DADOS/RESULTADOS_{year}.csv"
 
-    print(f"\nReading error data for year {year}...")
-    print(f"File: {file_name}")
-
-    items_file = f"microdados_enem_{year}/DADOS/ITENS_PROVA_{year}.csv"
+def load_booklets(year: int) -> tuple[list, list, list]:
+    # per area: (CO_PROVA, items in booklet order, answer key) for every booklet,
+    # the item order of the reference (white) booklet used as column order,
+    # and the answer key -> column index built from both (see booklet_index)
+    items_path = items_file(year)
     try:
-        items_df = pd.read_csv(items_file, sep=';', encoding='ISO-8859-1', dtype=str, low_memory=False)
-        for col in ['CO_POSICAO', 'SG_AREA', 'CO_ITEM', 'TX_GABARITO', 'TX_COR', 'CO_PROVA']:
-            if col not in items_df.columns:
-                raise KeyError(f"Missing column {col} in {items_file}")
+        items_columns = ['CO_POSICAO', 'SG_AREA', 'CO_ITEM', 'TX_GABARITO', 'TX_COR', 'CO_PROVA']
+        items_header = read_header(items_path)
+        for col in items_columns:
+            if col not in items_header:
+                raise KeyError(f"Missing column {col} in {items_path}")
+        items_df = load_frame(items_path, items_columns)
     except Exception as e:
-        print(f"  Warning: could not read items file ({items_file}) - will use position-based mapping. Error: {e}")
+        print(f"  Warning: could not read items file ({items_path}) - will use position-based mapping. Error: {e}")
         items_df = None
 
-    areas = ['CN', 'CH', 'LC', 'MT']
     per_area_provas = [[] for _ in range(4)]  
     canonical_order = [[] for _ in range(4)]
 
     if items_df is not None:
         items_df['CO_POSICAO'] = items_df['CO_POSICAO'].astype(int)
-        for area_index, area in enumerate(areas):
+        for area_index, area in enumerate(AREAS):
             df_area = items_df[items_df['SG_AREA'] == area]
             if df_area.empty:
                 continue
@@ -341,111 +300,113 @@ def read_error_data(year: int, max_rows: int = None, return_mapping: bool = Fals
             except Exception:
                 canonical_order[area_index] = []
 
-    with open(file_name, encoding='ISO-8859-1') as file:
-        labels = file.readline().strip().replace('\n', '').split(';')
+    return per_area_provas, canonical_order, booklet_index(per_area_provas, canonical_order)
 
-        answer_indices = [None] * 4
-        answer_key_indices = [None] * 4
-        for i, area in enumerate(areas):
-            ans_field = f"TX_RESPOSTAS_{area}"
-            key_field = f"TX_GABARITO_{area}"
-            try:
-                answer_indices[i] = labels.index(ans_field)
-            except ValueError:
-                answer_indices[i] = None
-            try:
-                answer_key_indices[i] = labels.index(key_field)
-            except ValueError:
-                answer_key_indices[i] = None
-
-        present_areas = [areas[i] for i in range(4) if answer_indices[i] is not None and answer_key_indices[i] is not None]
-        print(f"Found answer fields for areas: {present_areas}")
-
-        error_data = []
-        rows_read = 0
-        rows_processed = 0
-
-        for row in file:
-            rows_read += 1
-            if max_rows is not None and rows_read > max_rows:
-                break
-
-            raw_vals = row.strip().replace('\n', '').split(';')
-            student_errors = [False] * 180
-            valid_row = True
-
-            for area_index in range(4):
-                ai = answer_indices[area_index]
-                aki = answer_key_indices[area_index]
-                if ai is None or aki is None:
-                    continue
-
-                if ai >= len(raw_vals) or aki >= len(raw_vals):
-                    valid_row = False
-                    break
-
-                answers = raw_vals[ai]
-                answer_key = raw_vals[aki]
-                if not answers or not answer_key:
-                    valid_row = False
-                    break
-
-                mapped_items = None
-                if items_df is not None and per_area_provas[area_index]:
-                    for co_prova, items_list, key_str in per_area_provas[area_index]:
-                        if key_str == answer_key:
-                            mapped_items = items_list
-                            break
-
-                num_questions = min(len(answers), len(answer_key), 45)
-
-                if mapped_items is not None:
-                    for q_idx in range(num_questions):
-                        if q_idx >= len(answers) or q_idx >= len(answer_key):
-                            break
-                        student_answer = answers[q_idx]
-                        correct_answer = answer_key[q_idx]
-                        if student_answer != '.' and correct_answer != '.':
-                            co_item = mapped_items[q_idx] if q_idx < len(mapped_items) else None
-                            if co_item is None:
-                                global_pos = area_index * 45 + q_idx
-                            else:
-                                try:
-                                    canonical_pos = canonical_order[area_index].index(co_item)
-                                    global_pos = area_index * 45 + canonical_pos
-                                except ValueError:
-                                    # fallback to positional
-                                    global_pos = area_index * 45 + q_idx
-
-                            if 0 <= global_pos < 180:
-                                student_errors[global_pos] = (student_answer != correct_answer)
-                else:
-                    # fallback: assume positions align
-                    for q_idx in range(num_questions):
-                        if q_idx >= len(answers) or q_idx >= len(answer_key):
-                            break
-                        student_answer = answers[q_idx]
-                        correct_answer = answer_key[q_idx]
-                        if student_answer != '.' and correct_answer != '.':
-                            student_errors[area_index * 45 + q_idx] = (student_answer != correct_answer)
-
-            if valid_row:
-                error_data.append(student_errors)
-                rows_processed += 1
-                if rows_processed % 50000 == 0:
-                    print(f"  Processed {rows_processed} students...")
 
-    print(f"  Total rows read: {rows_read}")
-    print(f"  Valid students processed: {rows_processed}")
+def error_fields(header: list[str]) -> list[str]:
+    fields = []
+    for area in AREAS:
+        if f"TX_RESPOSTAS_{area}" in header and f"TX_GABARITO_{area}" in header:
+            fields += [f"TX_RESPOSTAS_{area}", f"TX_GABARITO_{area}"]
+    return fields
 
-    df = pd.DataFrame(error_data, dtype=bool)
-    df = df.fillna(False).astype(bool)
 
-    print(f"  DataFrame shape: {df.shape}")
-    print(f"  Total questions: {df.shape[1]}")
+def byte_matrix(raw: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray]:
+    # fixed-width (n, width) uint8 view of a bytes column, zero padded, plus each string's length
+    raw = np.ascontiguousarray(raw)
+    lengths = np.char.str_len(raw) if len(raw) else np.zeros(0, dtype=np.int64)
+    matrix = np.zeros((len(raw), max(width, raw.dtype.itemsize)), dtype=np.uint8)
+    if len(raw):
+        matrix[:, :raw.dtype.itemsize] = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    return matrix[:, :width], lengths
+
+
+def positional_targets(area_index: int) -> np.ndarray:
+    return area_index * 45 + np.arange(45)
+
+
+def booklet_index(per_area_provas: list, canonical_order: list) -> list[dict[str, np.ndarray]]:
+    # per area: answer key -> column of each of the 45 booklet positions, i.e. the
+    # item's position in the reference booklet, or the position itself when the item
+    # is not in it; the first booklet with a given key wins
+    index = [{} for _ in AREAS]
+    for area_index, provas in enumerate(per_area_provas):
+        canonical = {}
+        for position, co_item in enumerate(canonical_order[area_index]):
+            canonical.setdefault(co_item, position)
+
+        for co_prova, items_list, key_str in provas:
+            if key_str in index[area_index]:
+                continue
+            targets = positional_targets(area_index)
+            for q_idx, co_item in enumerate(items_list[:45]):
+                if co_item in canonical:
+                    targets[q_idx] = area_index * 45 + canonical[co_item]
+            index[area_index][key_str] = targets
+
+    return index
+
+
+def scatter_errors(errors: np.ndarray, rows: np.ndarray, targets: np.ndarray, counted: np.ndarray, wrong: np.ndarray) -> None:
+    # writes the counted questions of one booklet into their columns
+    inside = np.flatnonzero(targets < 180)
+    columns = targets[inside]
+    if len(np.unique(columns)) == len(columns):
+        block = errors[np.ix_(rows, columns)]
+        errors[np.ix_(rows, columns)] = np.where(counted[:, inside], wrong[:, inside], block)
+        return
+
+    # some questions share a column, the last counted one wins
+    for q_idx, column in zip(inside.tolist(), columns.tolist()):
+        write = rows[counted[:, q_idx]]
+        errors[write, column] = wrong[counted[:, q_idx], q_idx]
+
+
+def error_matrix(columns: dict[str, np.ndarray], booklets: tuple[list, list, list]) -> np.ndarray:
+    # (students, 180) error mask; a question counts when neither the answer nor the key is '.'
+    # and both strings reach it, and writes follow the booklet order of every area in turn,
+    # so a later question mapped to the same column wins, as in the original per-row loop
+    present_indices = [i for i, area in enumerate(AREAS) if f"TX_RESPOSTAS_{area}" in columns]
+    if not present_indices:
+        return np.zeros((0, 180), dtype=bool)
+
+    rows = len(columns[f"TX_RESPOSTAS_{AREAS[present_indices[0]]}"])
+    errors = np.zeros((rows, 180), dtype=bool)
+    valid = np.ones(rows, dtype=bool)
+    blank = ord(".")
+
+    for area_index in present_indices:
+        raw_keys = np.asarray(columns[f"TX_GABARITO_{AREAS[area_index]}"])
+        answers, answer_lengths = byte_matrix(columns[f"TX_RESPOSTAS_{AREAS[area_index]}"], 45)
+        answer_keys, key_lengths = byte_matrix(raw_keys, 45)
+        valid &= (answer_lengths > 0) & (key_lengths > 0)
+
+        reached = np.arange(45) < np.minimum(np.minimum(answer_lengths, key_lengths), 45)[:, None]
+        counted = reached & (answers != blank) & (answer_keys != blank)
+        wrong = answers != answer_keys
+
+        # students grouped by answer key: one dict lookup and one block write per booklet;
+        # unknown keys fall back to the booklet positions
+        key_index = booklets[2][area_index]
+        codes, unique_keys = pd.factorize(raw_keys)
+        order = np.argsort(codes, kind="stable")
+        ends = np.cumsum(np.bincount(codes, minlength=len(unique_keys)))
+        starts = np.concatenate([[0], ends[:-1]])
+        for code, key in enumerate(unique_keys.tolist()):
+            group = order[starts[code]:ends[code]]
+            targets = key_index.get(key.decode(ENCODING))
+            if targets is None:
+                targets = positional_targets(area_index)
+            scatter_errors(errors, group, targets, counted[group], wrong[group])
+
+    return errors[valid]
+
+
+def error_columns(booklets: tuple[list, list, list], width: int) -> list[str]:
+    canonical_order = booklets[1]
 
     col_mapping = []
-    for area_index, area in enumerate(areas):
+    for area_index, area in enumerate(AREAS):
         area_items = canonical_order[area_index]
         for item in area_items:
             col_mapping.append(f"{area}_{item}")
@@ -453,12 +414,77 @@ def read_error_data(year: int, max_rows: int = None, return_mapping: bool = Fals
             for i in range(len(area_items), 45):
                 col_mapping.append(f"{area}_pos{i}")
 
-    if len(col_mapping) > df.shape[1]:
-        col_mapping = col_mapping[:df.shape[1]]
-    elif len(col_mapping) < df.shape[1]:
-        for i in range(len(col_mapping), df.shape[1]):
+    if len(col_mapping) > width:
+        col_mapping = col_mapping[:width]
+    elif len(col_mapping) < width:
+        for i in range(len(col_mapping), width):
             col_mapping.append(f"idx_{i}")
 
+    return col_mapping
+
+
+def read_error_matrix(year: int, max_rows: int = None, workers: int | None = None) -> tuple[ErrorMatrix, list[str]]:
+    # bit-packed errors of every valid student, 23 bytes per row, plus the column names
+
+    file_name = data_file(year)
+
+    print(f"\nReading error data for year {year}...")
+    print(f"File: {file_name}")
+
+    booklets = load_booklets(year)
+
+    fields = error_fields(read_header(file_name))
+    present_areas = [field[len("TX_RESPOSTAS_"):] for field in fields if field.startswith("TX_RESPOSTAS_")]
+    print(f"Found answer fields for areas: {present_areas}")
+
+    rows_read = 0
+    students = 0
+    parts = []
+    # workers > 1 parses byte ranges of this one file in parallel
+    for columns in iter_columns(file_name, fields, workers=workers):
+        if max_rows is not None:
+            columns = {field: values[:max_rows - rows_read] for field, values in columns.items()}
+
+        rows_read += len(columns[fields[0]]) if fields else 0
+        parts.append(ErrorMatrix.from_bool(error_matrix(columns, booklets)))
+        students += len(parts[-1])
+        print(f"  Processed {students} students...")
+
+        if max_rows is not None and rows_read >= max_rows:
+            break
+
+    print(f"  Total rows read: {rows_read}")
+    print(f"  Valid students processed: {students}")
+
+    errors = ErrorMatrix.concat(parts) if parts else ErrorMatrix.from_bool(np.zeros((0, 180), dtype=bool))
+    print(f"  Packed size: {errors.nbytes() / 2**20:.1f} MiB")
+    return errors, error_columns(booklets, errors.columns if len(errors) else 0)
+
+
+def sample_error_matrix(year: int, sample_rows: int, seed=None) -> tuple[ErrorMatrix, list[str]]:
+    # read_error_matrix over a uniform random sample of sample_rows lines of the year; only
+    # those lines are parsed, after a one-time byte scan for the line index (see sample_columns)
+    file_name = data_file(year)
+
+    print(f"\nSampling {sample_rows} rows of error data for year {year}...")
+    print(f"File: {file_name}")
+
+    booklets = load_booklets(year)
+    columns = sample_columns(file_name, error_fields(read_header(file_name)), sample_rows, seed)
+    errors = ErrorMatrix.from_bool(error_matrix(columns, booklets))
+
+    print(f"  Valid students sampled: {len(errors)}")
+    return errors, error_columns(booklets, errors.columns if len(errors) else 0)
+
+
+def read_error_data(year: int, max_rows: int = None, return_mapping: bool = False, workers: int | None = None):
+    # the DataFrame costs a byte per question, read_error_matrix a bit
+    errors, col_mapping = read_error_matrix(year, max_rows, workers)
+    df = errors.to_frame() if len(errors) else pd.DataFrame([], dtype=bool)
+
+    print(f"  DataFrame shape: {df.shape}")
+    print(f"  Total questions: {df.shape[1]}")
+
     if return_mapping:
         return df, col_mapping
-    return df
\ No newline at end of file
+    return df
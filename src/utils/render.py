@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from types import ModuleType
+from typing import Callable
+
+import matplotlib
+
+from utils.parallel import resolve_workers, single_worker
+
+# ENEM_DPI and ENEM_FORMAT change every figure, e.g. ENEM_DPI=150 for quick drafts;
+# with ENEM_RENDER_SKIP=1, figures whose payload is unchanged since the last run are not redrawn
+RENDER_DPI = int(os.environ.get("ENEM_DPI", "600"))
+RENDER_FORMAT = os.environ.get("ENEM_FORMAT", "png")
+RENDER_SKIP = os.environ.get("ENEM_RENDER_SKIP", "0") == "1"
+RENDER_MANIFEST = "./output/render_manifest.json"
+# the project's own code (src/), whose modules are part of each figure's digest
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Figure:
+    # draw(*args) draws on the current pyplot figure without saving it; args
+    # are the precomputed aggregates, so they stay small enough to send to a worker
+    path: str  # without extension
+    draw: Callable
+    args: tuple
+
+    def file_name(self, fmt: str) -> str:
+        return f"{self.path}.{fmt}"
+
+    def digest(self, dpi: int, fmt: str) -> str:
+        # the sources of the draw function's module and of the project modules it uses are
+        # included, so editing its styling, labels or helpers (e.g. utils/geo.py) redraws the figure
+        files = sorted({os.path.abspath(self.draw.__code__.co_filename)} | set(dependency_files(self.draw.__module__)))
+        sources = [source_digest(file_name) for file_name in files]
+        content = pickle.dumps((self.draw.__qualname__, sources, self.args, dpi, fmt), protocol=4)
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def dependency_files(module_name: str) -> tuple[str, ...]:
+    # source files under src/ of a module and of every module it uses, directly or not,
+    # found through the modules, functions and classes in its namespace
+    seen = set()
+    pending = [sys.modules.get(module_name)]
+    while pending:
+        module = pending.pop()
+        file_name = os.path.abspath(getattr(module, "__file__", None) or "")
+        if module is None or module.__name__ in seen or not file_name.startswith(SOURCE_DIR + os.sep):
+            continue
+
+        seen.add(module.__name__)
+        for value in vars(module).values():
+            pending.append(value if isinstance(value, ModuleType) else sys.modules.get(getattr(value, "__module__", None) or ""))
+
+    return tuple(sorted(os.path.abspath(sys.modules[name].__file__) for name in seen))
+
+
+@lru_cache(maxsize=None)
+def source_digest(file_name: str) -> str:
+    with open(file_name, "rb") as file:
+        return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+
+def render_worker() -> None:
+    single_worker()
+    matplotlib.use("Agg")
+
+
+def output_dpi() -> float:
+    # resolution the current figure will be saved at, for draw functions that adapt their detail
+    import matplotlib.pyplot as plt
+
+    dpi = plt.rcParams["savefig.dpi"]
+    return plt.rcParams["figure.dpi"] if dpi == "figure" else dpi
+
+
+def render_figure(figure: Figure, dpi: int, fmt: str) -> str:
+    import matplotlib.pyplot as plt
+
+    with plt.rc_context({"savefig.dpi": dpi}):
+        figure.draw(*figure.args)
+        plt.savefig(figure.file_name(fmt), dpi=dpi, format=fmt)
+    plt.close("all")
+    return figure.file_name(fmt)
+
+
+def load_render_manifest() -> dict:
+    try:
+        with open(RENDER_MANIFEST) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_render_manifest(manifest: dict) -> None:
+    tmp_path = f"{RENDER_MANIFEST}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, RENDER_MANIFEST)
+
+
+def render(figures: list[Figure], dpi: int | None = None, fmt: str | None = None,
+           workers: int | None = None, skip_unchanged: bool | None = None) -> list[str]:
+    # saves every figure, in ENEM_WORKERS processes on the Agg backend;
+    # returns the files actually written
+    dpi = RENDER_DPI if dpi is None else dpi
+    fmt = RENDER_FORMAT if fmt is None else fmt
+    skip_unchanged = RENDER_SKIP if skip_unchanged is None else skip_unchanged
+    workers = resolve_workers(workers)
+
+    manifest = load_render_manifest()
+    digests = {figure.file_name(fmt): figure.digest(dpi, fmt) for figure in figures}
+    if skip_unchanged:
+        pending = [figure for figure in figures
+                   if manifest.get(figure.file_name(fmt)) != digests[figure.file_name(fmt)]
+                   or not os.path.exists(figure.file_name(fmt))]
+        if len(pending) < len(figures):
+            print(f"Skipping {len(figures) - len(pending)} unchanged figures.")
+    else:
+        pending = figures
+
+    if workers <= 1 or len(pending) <= 1:
+        matplotlib.use("Agg")
+        written = [render_figure(figure, dpi, fmt) for figure in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=render_worker) as executor:
+            written = list(executor.map(render_figure, pending, [dpi] * len(pending), [fmt] * len(pending)))
+
+    if os.path.isdir(os.path.dirname(RENDER_MANIFEST)):
+        manifest.update({file_name: digests[file_name] for file_name in written})
+        save_render_manifest(manifest)
+
+    return written
@@ -0,0 +1,184 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from utils.stats import GroupedQuantileSketch
+
+# columns of mlxtend's association_rules, in the same order
+RULE_METRICS = [
+    "antecedent support", "consequent support", "support", "confidence", "lift",
+    "representativity", "leverage", "conviction", "zhangs_metric", "jaccard",
+    "certainty", "kulczynski",
+]
+
+
+def rule_metrics(sAC: np.ndarray, sA: np.ndarray, sC: np.ndarray, num_itemsets: int) -> dict:
+    # association_rules' formulas for data without null values; confidence keeps its
+    # num_itemsets scaling so every value matches mlxtend to the last bit
+    sAC, sA, sC = (np.asarray(values, dtype=float) for values in (sAC, sA, sC))
+    confidence = sAC * num_itemsets / (sA * num_itemsets)
+    reverse_confidence = sAC * num_itemsets / (sC * num_itemsets)
+    leverage = sAC - sA * sC
+
+    conviction = np.full(confidence.shape, np.inf)
+    below = confidence < 1.0
+    conviction[below] = (1.0 - sC[below]) / (1.0 - confidence[below])
+
+    zhang_denominator = np.maximum(sAC * (1 - sA), sA * (sC - sAC))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zhangs_metric = np.where(zhang_denominator == 0, 0, leverage / zhang_denominator)
+        certainty = np.where(1 - sC == 0, 0, (confidence - sC) / (1 - sC))
+
+    return {
+        "antecedent support": sA,
+        "consequent support": sC,
+        "support": sAC,
+        "confidence": confidence,
+        "lift": confidence / sC,
+        "representativity": np.ones(confidence.shape),
+        "leverage": leverage,
+        "conviction": conviction,
+        "zhangs_metric": zhangs_metric,
+        "jaccard": sAC / (sA + sC - sAC),
+        "certainty": certainty,
+        "kulczynski": (confidence + reverse_confidence) / 2,
+    }
+
+
+def frequent_pairs(item_counts: np.ndarray, pair_counts: np.ndarray, rows: int,
+                   min_support: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # the two levels of apriori: items with support >= min_support, then pairs of
+    # frequent items (in the same order) with count >= min_support * rows;
+    # returns (items, first item, second item, pair support)
+    item_support = np.asarray(item_counts) / rows
+    items = np.flatnonzero(item_support >= min_support)
+    first, second = np.triu_indices(len(items), k=1)
+    first, second = items[first], items[second]
+    counts = np.asarray(pair_counts)[first, second]
+    keep = counts >= min_support * rows
+    return items, first[keep], second[keep], counts[keep] / float(rows)
+
+
+def pair_rules(item_counts: np.ndarray, pair_counts: np.ndarray, rows: int,
+               min_support: float, min_confidence: float) -> pd.DataFrame:
+    # apriori(max_len=2) + association_rules(metric="confidence") from the
+    # item counts and the item x item co-occurrence counts alone
+    item_support = np.asarray(item_counts) / rows
+    items, first, second, supports = frequent_pairs(item_counts, pair_counts, rows, min_support)
+    num_itemsets = len(items) + len(supports)
+
+    # association_rules splits each pair in its frozenset iteration order
+    leading = np.array([next(iter(frozenset(pair))) for pair in zip(first.tolist(), second.tolist())], dtype=np.int64)
+    trailing = first + second - leading
+    antecedents = np.column_stack([leading, trailing]).ravel()
+    consequents = np.column_stack([trailing, leading]).ravel()
+    sAC = np.repeat(supports, 2)
+    sA = item_support[antecedents]
+    sC = item_support[consequents]
+
+    keep = sAC * num_itemsets / (sA * num_itemsets) >= min_confidence
+    if not keep.any():
+        return pd.DataFrame(columns=["antecedents", "consequents"] + RULE_METRICS)
+
+    rules = pd.DataFrame({
+        "antecedents": [frozenset((item,)) for item in antecedents[keep].tolist()],
+        "consequents": [frozenset((item,)) for item in consequents[keep].tolist()],
+    })
+    for name, values in rule_metrics(sAC[keep], sA[keep], sC[keep], num_itemsets).items():
+        rules[name] = values
+    return rules
+
+
+def select_rules(batch: dict, mask: np.ndarray) -> dict:
+    # the rules of a batch (as yielded by ItemsetCounts.rule_batches) where mask is set
+    chosen = np.flatnonzero(mask).tolist()
+    return {name: [values[i] for i in chosen] if isinstance(values, list) else values[mask]
+            for name, values in batch.items()}
+
+
+class TopRules:
+    # the k best rules by metric, then by secondary, then in generation order, in a min-heap
+    # of k entries fed batch by batch, so memory does not grow with the number of rules
+    def __init__(self, k: int, metric: str = "confidence", secondary: str | None = "lift"):
+        self.k = k
+        self.metric = metric
+        self.secondary = secondary
+        self.columns = None
+        self.heap = []
+
+    def push(self, entry: tuple) -> None:
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:3] > self.heap[0][:3]:
+            heapq.heapreplace(self.heap, entry)
+
+    def update(self, batch: dict) -> "TopRules":
+        primary = np.asarray(batch[self.metric], dtype=float)
+        secondary = np.asarray(batch[self.secondary], dtype=float) if self.secondary else np.zeros(len(primary))
+
+        # only rules at least as good as the current k-th can enter the heap
+        candidates = np.arange(len(primary))
+        if len(self.heap) == self.k:
+            candidates = candidates[primary >= self.heap[0][0]]
+
+        self.columns = list(batch)
+        for i in candidates.tolist():
+            row = tuple(batch[name][i] for name in self.columns)
+            self.push((float(primary[i]), float(secondary[i]), -int(batch["index"][i]), row))
+        return self
+
+    def merge(self, other: "TopRules") -> "TopRules":
+        self.columns = self.columns or other.columns
+        for entry in other.heap:
+            self.push(entry)
+        return self
+
+    def rules(self) -> pd.DataFrame:
+        # best first, indexed by the rule numbers of the batches
+        if not self.heap:
+            return pd.DataFrame(columns=["antecedents", "consequents"] + RULE_METRICS)
+        entries = sorted(self.heap, reverse=True, key=lambda entry: entry[:3])
+        rules = pd.DataFrame([entry[3] for entry in entries], columns=self.columns)
+        return rules.set_index("index").rename_axis(None)
+
+
+class RuleStatistics:
+    # what analyze_rules_statistics reports, accumulated batch by batch: exact count,
+    # mean, min and max, medians within one bin (1/bins of the range), rules per antecedent size
+    def __init__(self, lift_upper: float, bins: int = 1 << 16):
+        # lift = confidence / consequent support <= 1 / min_support
+        self.sketches = {
+            "support": GroupedQuantileSketch(0, 1, 1 / bins),
+            "confidence": GroupedQuantileSketch(0, 1, 1 / bins),
+            "lift": GroupedQuantileSketch(0, lift_upper, lift_upper / bins),
+        }
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.count = 0
+
+    def update(self, batch: dict) -> "RuleStatistics":
+        rows = len(batch["support"])
+        groups = np.zeros(rows, dtype=np.int64)
+        for name, sketch in self.sketches.items():
+            sketch.update(groups, batch[name])
+
+        sizes = np.bincount(np.array([len(antecedent) for antecedent in batch["antecedents"]], dtype=np.int64), minlength=len(self.sizes))
+        self.sizes = np.pad(self.sizes, (0, len(sizes) - len(self.sizes))) + sizes
+        self.count += rows
+        return self
+
+    def merge(self, other: "RuleStatistics") -> "RuleStatistics":
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        width = max(len(self.sizes), len(other.sizes))
+        self.sizes = np.pad(self.sizes, (0, width - len(self.sizes))) + np.pad(other.sizes, (0, width - len(other.sizes)))
+        self.count += other.count
+        return self
+
+    def summary(self) -> tuple[dict, dict]:
+        # ({metric: (mean, median, min, max)}, {antecedent size: rules})
+        metrics = {}
+        for name, sketch in self.sketches.items():
+            stats = sketch.stats()[0]
+            metrics[name] = (stats["mean"], stats["med"], stats["min"], stats["max"])
+        return metrics, {size: int(count) for size, count in enumerate(self.sizes.tolist()) if count > 0}
@@ -0,0 +1,113 @@
+from typing import Callable
+
+import numpy as np
+
+from utils.cache import CACHE_ENABLED, iter_columns
+from utils.engine import GRADE_FIELDS, read_header
+from utils.parallel import map_years, resolve_workers
+from utils.compact import ErrorMatrix, SocioeconomicData
+from utils.read import (SOCIOECONOMIC_COMPACT_FIELDS, UF_SCHOOL_TYPE_FIELDS, UF_SCHOOL_TYPE_SHAPE,
+                        data_file, error_columns, error_fields,
+                        error_matrix, grade_arrays, ingest_year, load_booklets,
+                        socioeconomic_compact, uf_school_type_totals)
+from utils.stats import GroupTotals, Histogram2DAccumulator, MomentAccumulator
+
+
+class Consumer:
+    # fields is either a list or a function of the file header, convert turns
+    # one chunk of columns into a partial result and finish merges the
+    # partial results of all years once the scan is over
+    def __init__(self, fields: list[str] | Callable, convert: Callable, finish: Callable, years: list[int]):
+        self.fields = fields
+        self.convert = convert
+        self.finish = finish
+        self.years = list(years)
+        self.parts = {year: [] for year in self.years}
+
+    def fields_for(self, header: list[str]) -> list[str]:
+        if callable(self.fields):
+            return self.fields(header)
+        return self.fields
+
+    def consume(self, year: int, columns: dict[str, np.ndarray]) -> None:
+        self.parts[year].append(self.convert(year, columns))
+
+    def result(self):
+        return self.finish(self.parts)
+
+
+def grades_consumer(years: tuple = (2020, 2021, 2022, 2023, 2024), bins: int = 50) -> Consumer:
+    # regression moments and heatmap counts per year, as area_regression.accumulate;
+    # each chunk leaves only its two small accumulators behind
+    def convert(year, columns):
+        grades = grade_arrays(columns)
+        return MomentAccumulator().update(grades), Histogram2DAccumulator(bins=bins).update(grades)
+
+    def finish(parts):
+        return {year: (MomentAccumulator.merged([moments for moments, _ in chunks]),
+                       Histogram2DAccumulator.merged([heatmaps for _, heatmaps in chunks]))
+                for year, chunks in sorted(parts.items()) if chunks}
+
+    return Consumer(GRADE_FIELDS, convert, finish, years)
+
+def socioeconomic_compact_consumer(years: tuple = (2020, 2021, 2023)) -> Consumer:
+    def convert(year, columns):
+        data = socioeconomic_compact(columns)
+        data.year[:] = year
+        return data
+
+    def finish(parts):
+        return SocioeconomicData.concat([data for year in sorted(parts) for data in parts[year]])
+
+    return Consumer(SOCIOECONOMIC_COMPACT_FIELDS, convert, finish, years)
+
+def uf_school_type_consumer(years: tuple = (2020, 2021, 2022, 2023, 2024)) -> Consumer:
+    # one GroupTotals per year, as returned by read_uf_school_type_totals
+    return Consumer(UF_SCHOOL_TYPE_FIELDS, lambda year, columns: uf_school_type_totals(columns),
+                    lambda parts: {year: GroupTotals.merged([GroupTotals(UF_SCHOOL_TYPE_SHAPE)] + totals)
+                                   for year, totals in parts.items()}, years)
+
+def error_consumer(years: list[int]) -> Consumer:
+    # one (ErrorMatrix, column mapping) pair per year, as returned by read_error_matrix
+    booklets = {}
+
+    def convert(year, columns):
+        if year not in booklets:
+            booklets[year] = load_booklets(year)
+        return ErrorMatrix.from_bool(error_matrix(columns, booklets[year]))
+
+    def finish(parts):
+        results = {}
+        for year, matrices in parts.items():
+            errors = ErrorMatrix.concat(matrices) if matrices else ErrorMatrix.from_bool(np.zeros((0, 180), dtype=bool))
+            results[year] = (errors, error_columns(booklets.get(year) or load_booklets(year), errors.columns if len(errors) else 0))
+        return results
+
+    return Consumer(error_fields, convert, finish, years)
+
+
+def scan(consumers: list[Consumer], workers: int | None = None) -> None:
+    # reads every year once, with the union of the columns the consumers need,
+    # and hands each chunk to all the consumers registered for that year
+    years = sorted({year for consumer in consumers for year in consumer.years})
+
+    # consumers keep their state in this process, so only the cache build
+    # (the CSV parsing) is spread over the workers
+    workers = resolve_workers(workers)
+    if CACHE_ENABLED and workers > 1:
+        map_years(ingest_year, years, workers)
+
+    for year in years:
+        file_name = data_file(year)
+        header = read_header(file_name)
+
+        active = [(consumer, consumer.fields_for(header)) for consumer in consumers if year in consumer.years]
+        active = [(consumer, fields) for consumer, fields in active if fields]
+        fields = list(dict.fromkeys(field for _, consumer_fields in active for field in consumer_fields))
+
+        print(f"Scanning year {year} ({len(fields)} columns, {len(active)} consumers)...")
+        for columns in iter_columns(file_name, fields):
+            for consumer, consumer_fields in active:
+                consumer.consume(year, {field: columns[field] for field in consumer_fields})
+
+        print(f"Scanned year {year}.")
@@ -0,0 +1,317 @@
+from statistics import NormalDist
+
+import numpy as np
+
+
+def linear_fit(n, x, y, x2, y2, xy) -> tuple[float, float, float]:
+    # (r, slope, intercept) from the sums of x, y, x^2, y^2 and xy
+    r = (n*xy - x*y)/((n*x2-x**2)*(n*y2 - y**2))**(1/2)
+    a = (n*xy - x*y) / (n*x2 - x**2)
+    b = (y - a*x) / n
+    return r, a, b
+
+
+def wilson_interval(p, n, level: float = 0.95) -> tuple[np.ndarray, np.ndarray]:
+    # Wilson score interval of proportions p observed over n trials each
+    p = np.asarray(p, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    z = NormalDist().inv_cdf((1 + level) / 2)
+    center = (p + z*z / (2*n)) / (1 + z*z / n)
+    half = z / (1 + z*z / n) * np.sqrt(p*(1 - p) / n + z*z / (4*n*n))
+    return np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+
+
+class MomentAccumulator:
+    # sufficient statistics for every pairwise linear regression between the
+    # columns of a stream of (n, dims) chunks: count, sums and the full
+    # cross-product matrix; accumulators of different chunks, years or
+    # processes are combined with merge
+    def __init__(self, dims: int = 5):
+        self.n = 0
+        self.sums = np.zeros(dims)
+        self.cross = np.zeros((dims, dims))
+
+    def update(self, values: np.ndarray) -> "MomentAccumulator":
+        values = np.asarray(values, dtype=np.float64)
+        self.n += len(values)
+        self.sums += values.sum(axis=0)
+        self.cross += values.T @ values
+        return self
+
+    def merge(self, other: "MomentAccumulator") -> "MomentAccumulator":
+        self.n += other.n
+        self.sums += other.sums
+        self.cross += other.cross
+        return self
+
+    @classmethod
+    def merged(cls, accumulators: list["MomentAccumulator"]) -> "MomentAccumulator":
+        total = cls(len(accumulators[0].sums))
+        for accumulator in accumulators:
+            total.merge(accumulator)
+        return total
+
+    def pair_sums(self, i: int, j: int) -> tuple:
+        # (n, x, y, x2, y2, xy) as used by the regression formulas
+        return self.n, self.sums[i], self.sums[j], self.cross[i, i], self.cross[j, j], self.cross[i, j]
+
+    def fit(self, i: int, j: int) -> tuple[float, float, float]:
+        # (r, slope, intercept) of column j regressed on column i
+        return linear_fit(*self.pair_sums(i, j))
+
+    def fits(self) -> dict[tuple[int, int], tuple[float, float, float]]:
+        dims = len(self.sums)
+        return {(i, j): self.fit(i, j) for i in range(dims) for j in range(i+1, dims)}
+
+
+class Histogram2DAccumulator:
+    # np.histogram2d counts over a fixed range for every pair of columns of a
+    # stream of (n, dims) chunks; each column is binned once per chunk and the
+    # pair counts come from a single bincount, so chunks never need to be kept
+    def __init__(self, dims: int = 5, bins: int = 50, lower: float = 0, upper: float = 1000):
+        self.dims = dims
+        self.bins = bins
+        self.edges = np.linspace(lower, upper, bins + 1)
+        self.pairs = [(i, j) for i in range(dims) for j in range(i+1, dims)]
+        self.counts = np.zeros((len(self.pairs), bins, bins), dtype=np.int64)
+
+    def bin_indices(self, values: np.ndarray) -> np.ndarray:
+        # same binning as np.histogram2d: half-open bins, the last one closed,
+        # values outside the range get -1
+        indices = np.searchsorted(self.edges, values, side="right") - 1
+        indices[values == self.edges[-1]] = self.bins - 1
+        indices[(values < self.edges[0]) | (values > self.edges[-1]) | np.isnan(values)] = -1
+        return indices
+
+    def update(self, values: np.ndarray) -> "Histogram2DAccumulator":
+        values = np.asarray(values, dtype=np.float64)
+        indices = [self.bin_indices(values[:, i]) for i in range(values.shape[1])]
+
+        for k, (i, j) in enumerate(self.pairs):
+            inside = (indices[i] >= 0) & (indices[j] >= 0)
+            cells = indices[i][inside] * self.bins + indices[j][inside]
+            self.counts[k] += np.bincount(cells, minlength=self.bins * self.bins).reshape(self.bins, self.bins)
+        return self
+
+    def merge(self, other: "Histogram2DAccumulator") -> "Histogram2DAccumulator":
+        self.counts += other.counts
+        return self
+
+    @classmethod
+    def merged(cls, accumulators: list["Histogram2DAccumulator"]) -> "Histogram2DAccumulator":
+        first = accumulators[0]
+        total = cls(first.dims, first.bins, first.edges[0], first.edges[-1])
+        for accumulator in accumulators:
+            total.merge(accumulator)
+        return total
+
+    def heatmap(self, i: int, j: int) -> np.ndarray:
+        # (heatmap, xedges, yedges) as returned by np.histogram2d
+        return self.counts[self.pairs.index((i, j))].astype(np.float64), self.edges, self.edges
+
+
+def sorted_quantile(values: np.ndarray, q: float) -> float:
+    # linear interpolation between closest ranks, as np.percentile, on sorted values
+    position = q * (len(values) - 1)
+    lower = int(np.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def box_stats(count: int, total: float, minimum: float, maximum: float, q1: float, med: float, q3: float,
+              whislo: float, whishi: float) -> dict:
+    # the dict matplotlib's Axes.bxp expects, plus count/mean/min/max
+    return {"count": count, "mean": total / count, "min": minimum, "max": maximum,
+            "q1": q1, "med": med, "q3": q3, "whislo": whislo, "whishi": whishi}
+
+
+def grouped_box_stats(groups: np.ndarray, values: np.ndarray) -> dict[int, dict]:
+    # exact box statistics of values for every group code, from one sort by (group, value);
+    # whiskers follow matplotlib: the furthest data within 1.5 IQR of the box; the mean is
+    # summed over each group's values in their original order, as np.mean of the group would
+    in_order = values[np.argsort(groups, kind="stable")]
+    order = np.lexsort((values, groups))
+    groups = groups[order]
+    values = values[order]
+    keys, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+
+    stats = {}
+    for key, start, count in zip(keys.tolist(), starts.tolist(), counts.tolist()):
+        group = values[start:start + count]
+        q1, med, q3 = (sorted_quantile(group, q) for q in (0.25, 0.5, 0.75))
+        iqr = q3 - q1
+
+        whishi = group[np.searchsorted(group, q3 + 1.5 * iqr, side="right") - 1]
+        whislo = group[np.searchsorted(group, q1 - 1.5 * iqr, side="left")]
+        stats[key] = box_stats(count, in_order[start:start + count].sum(), group[0], group[-1], q1, med, q3,
+                               max(whislo, group[0]) if whislo <= q1 else q1,
+                               whishi if whishi >= q3 else q3)
+
+    return stats
+
+
+class GroupedQuantileSketch:
+    # streaming, mergeable stand-in for grouped_box_stats: per group a fixed
+    # width histogram of the values, plus exact count, sum, min and max;
+    # quantiles and whiskers are accurate to one bin width
+    def __init__(self, lower: float = 0, upper: float = 1000, bin_width: float = 0.5):
+        self.lower = lower
+        self.bin_width = bin_width
+        self.bins = int(round((upper - lower) / bin_width))
+        self.counts = np.zeros((0, self.bins), dtype=np.int64)
+        self.sums = np.zeros(0)
+        self.mins = np.zeros(0)
+        self.maxs = np.zeros(0)
+
+    def grow(self, groups: int) -> None:
+        extra = groups - len(self.sums)
+        if extra > 0:
+            self.counts = np.vstack([self.counts, np.zeros((extra, self.bins), dtype=np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros(extra)])
+            self.mins = np.concatenate([self.mins, np.full(extra, np.inf)])
+            self.maxs = np.concatenate([self.maxs, np.full(extra, -np.inf)])
+
+    def update(self, groups: np.ndarray, values: np.ndarray) -> "GroupedQuantileSketch":
+        if len(groups) == 0:
+            return self
+
+        groups = np.asarray(groups, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        self.grow(int(groups.max()) + 1)
+        size = len(self.sums)
+
+        cells = np.clip(((values - self.lower) / self.bin_width).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(groups * self.bins + cells, minlength=size * self.bins).reshape(size, self.bins)
+        self.sums += np.bincount(groups, weights=values, minlength=size)
+        np.minimum.at(self.mins, groups, values)
+        np.maximum.at(self.maxs, groups, values)
+        return self
+
+    def merge(self, other: "GroupedQuantileSketch") -> "GroupedQuantileSketch":
+        self.grow(len(other.sums))
+        size = len(other.sums)
+        self.counts[:size] += other.counts
+        self.sums[:size] += other.sums
+        self.mins[:size] = np.minimum(self.mins[:size], other.mins)
+        self.maxs[:size] = np.maximum(self.maxs[:size], other.maxs)
+        return self
+
+    def order_statistic(self, group: int, cumulative: np.ndarray, rank: int) -> float:
+        # the rank-th smallest value (0-based), spread evenly inside its bin
+        counts = self.counts[group]
+        cell = int(np.searchsorted(cumulative, rank, side="right"))
+        before = cumulative[cell] - counts[cell]
+        value = self.lower + self.bin_width * (cell + (rank - before + 0.5) / counts[cell])
+        return float(np.clip(value, self.mins[group], self.maxs[group]))
+
+    def quantile(self, group: int, q: float) -> float:
+        # same interpolation as sorted_quantile, between estimated order statistics
+        cumulative = np.cumsum(self.counts[group])
+        position = q * (cumulative[-1] - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, int(cumulative[-1]) - 1)
+        low_value = self.order_statistic(group, cumulative, lower)
+        high_value = self.order_statistic(group, cumulative, upper)
+        return low_value + (high_value - low_value) * (position - lower)
+
+    def count_up_to(self, group: int, cumulative: np.ndarray, value: float) -> int:
+        # how many of the order statistics estimated above are <= value
+        cell = int(np.floor((value - self.lower) / self.bin_width))
+        if cell < 0:
+            return 0
+        if cell >= self.bins:
+            return int(cumulative[-1])
+
+        count = self.counts[group, cell]
+        fraction = (value - self.lower) / self.bin_width - cell
+        inside = int(np.clip(np.floor(fraction * count - 0.5) + 1, 0, count))
+        return int(cumulative[cell] - count) + inside
+
+    def stats(self) -> dict[int, dict]:
+        stats = {}
+        for group in np.flatnonzero(self.counts.sum(axis=1)).tolist():
+            cumulative = np.cumsum(self.counts[group])
+            q1, med, q3 = (self.quantile(group, q) for q in (0.25, 0.5, 0.75))
+            iqr = q3 - q1
+
+            # whiskers end at the furthest estimated data point inside the fences
+            below = self.count_up_to(group, cumulative, q3 + 1.5 * iqr)
+            whishi = self.order_statistic(group, cumulative, below - 1) if below > 0 else q3
+            above = self.count_up_to(group, cumulative, np.nextafter(q1 - 1.5 * iqr, -np.inf))
+            whislo = self.order_statistic(group, cumulative, above) if above < cumulative[-1] else q1
+
+            stats[group] = box_stats(int(cumulative[-1]), self.sums[group], self.mins[group], self.maxs[group],
+                                     q1, med, q3, min(whislo, q1), max(whishi, q3))
+
+        return stats
+
+
+class GroupTotals:
+    # sum and count of a value in every cell of a small dense grid of integer
+    # codes (e.g. UF x school type), filled with one bincount per chunk
+    def __init__(self, shape: tuple):
+        self.shape = tuple(shape)
+        self.sums = np.zeros(self.shape)
+        self.counts = np.zeros(self.shape, dtype=np.int64)
+
+    def update(self, keys: tuple, values: np.ndarray) -> "GroupTotals":
+        cells = np.ravel_multi_index(tuple(np.asarray(key, dtype=np.int64) for key in keys), self.shape)
+        size = self.sums.size
+        self.sums += np.bincount(cells, weights=np.asarray(values, dtype=np.float64), minlength=size).reshape(self.shape)
+        self.counts += np.bincount(cells, minlength=size).reshape(self.shape)
+        return self
+
+    def merge(self, other: "GroupTotals") -> "GroupTotals":
+        self.sums += other.sums
+        self.counts += other.counts
+        return self
+
+    @classmethod
+    def merged(cls, parts: list["GroupTotals"]) -> "GroupTotals":
+        parts = list(parts)
+        total = cls(parts[0].shape)
+        for part in parts:
+            total.merge(part)
+        return total
+
+
+class KeyedTotals:
+    # GroupTotals for sparse integer keys (e.g. IBGE municipality codes):
+    # sorted unique keys with the sum and count of a value for each
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, keys: np.ndarray, sums: np.ndarray, counts: np.ndarray) -> "KeyedTotals":
+        # keys must be sorted and unique
+        merged = np.union1d(self.keys, keys)
+        new_sums = np.zeros(len(merged))
+        new_counts = np.zeros(len(merged), dtype=np.int64)
+        for part_keys, part_sums, part_counts in [(self.keys, self.sums, self.counts), (keys, sums, counts)]:
+            index = np.searchsorted(merged, part_keys)
+            new_sums[index] += part_sums
+            new_counts[index] += part_counts
+
+        self.keys, self.sums, self.counts = merged, new_sums, new_counts
+        return self
+
+    def update(self, keys: np.ndarray, values: np.ndarray) -> "KeyedTotals":
+        unique, inverse = np.unique(np.asarray(keys, dtype=np.int64), return_inverse=True)
+        sums = np.bincount(inverse, weights=np.asarray(values, dtype=np.float64), minlength=len(unique))
+        return self.add(unique, sums, np.bincount(inverse, minlength=len(unique)))
+
+    def merge(self, other: "KeyedTotals") -> "KeyedTotals":
+        return self.add(other.keys, other.sums, other.counts)
+
+    @classmethod
+    def merged(cls, parts: list["KeyedTotals"]) -> "KeyedTotals":
+        total = cls()
+        for part in parts:
+            total.merge(part)
+        return total
+
+    def means(self, min_count: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (keys, mean value, count) of the keys seen at least min_count times
+        keep = self.counts >= max(min_count, 1)
+        return self.keys[keep], self.sums[keep] / self.counts[keep], self.counts[keep]